@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+'''A binary format for whole treebanks, which is quicker to load than
+bracketed text, and allows any tree to be read without reading the ones
+before it.
+
+A file contains:
+ - A header, MAGIC
+ - Each tree as a flat array of ints (see encode_tree), with nothing for an
+   empty tree
+ - The tables of labels and words, and the offset of the start of each tree
+   (plus the end of the last one), written with marshal
+ - A footer, with the offset of the tables and MAGIC again'''
+
+import marshal, struct
+from array import array
+
+from pstree import *
+
+MAGIC = 'NLPTB1'
+footer_format = struct.Struct('<Q6s')
+
+def encode_tree(tree, labels, words):
+  '''Flatten a tree into a string of ints, seven per node in pre-order: label,
+  word, number of subtrees, span start and end, and wordspan start and end.
+  Labels and words are stored as positions in the given lists (for words, one
+  more than the position, with 0 for no word), where words is a pair of a list
+  and a dictionary from word to position, and similarly for labels.  Values
+  are stored in two bytes each when they all fit.
+
+  >>> tree = tree_from_text("(ROOT (S (NP-SBJ (NNP Ms.) (NNP Haag)) (VP (VBZ plays) (NP (NNP Elianti))) (. .)))")
+  >>> labels, words = ([], {}), ([], {})
+  >>> data = encode_tree(tree, labels, words)
+  >>> print decode_tree(data, labels[0], words[0])
+  (ROOT (S (NP-SBJ (NNP Ms.) (NNP Haag)) (VP (VBZ plays) (NP (NNP Elianti))) (. .)))
+  >>> labels[0]
+  ['ROOT', 'S', 'NP-SBJ', 'NNP', 'VP', 'VBZ', 'NP', '.']'''
+  ans = array('i')
+  for node in tree:
+    label = labels[1].get(node.label)
+    if label is None:
+      label = len(labels[0])
+      labels[0].append(node.label)
+      labels[1][node.label] = label
+    word = -1
+    if node.word is not None:
+      word = words[1].get(node.word)
+      if word is None:
+        word = len(words[0])
+        words[0].append(node.word)
+        words[1][node.word] = word
+    ans.extend((label, word + 1, len(node.subtrees), node.span[0], node.span[1], node.wordspan[0], node.wordspan[1]))
+  if min(ans) >= 0 and max(ans) < 1 << 16:
+    return 'H' + array('H', ans).tostring()
+  return 'i' + ans.tostring()
+
+def decode_tree(data, labels, words):
+  '''Construct a tree from the output of encode_tree.'''
+  values = array(data[0])
+  values.fromstring(data[1:])
+  root = None
+  # Nodes that still have subtrees to add, with the number remaining
+  stack = []
+  for pos in xrange(0, len(values), 7):
+    label, word, count, start, end, wordstart, wordend = values[pos:pos + 7]
+    node = PSTree(None if word == 0 else words[word - 1], labels[label], (start, end))
+    node.wordspan = (wordstart, wordend)
+    if len(stack) > 0:
+      parent = stack[-1]
+      node.parent = parent[0]
+      parent[0].subtrees.append(node)
+      parent[1] -= 1
+    else:
+      root = node
+    if count > 0:
+      stack.append([node, count])
+    else:
+      while len(stack) > 0 and stack[-1][1] == 0:
+        stack.pop()
+  return root
+
+class BinaryTreebankWriter:
+  '''Write trees to a file in the binary format, one at a time.  None can be
+  added to record an empty tree.  The file is only complete once close is
+  called.'''
+  def __init__(self, filename):
+    self.out = open(filename, 'wb')
+    self.out.write(MAGIC)
+    self.offsets = [len(MAGIC)]
+    self.labels = ([], {})
+    self.words = ([], {})
+
+  def add(self, tree):
+    if tree is not None:
+      self.out.write(encode_tree(tree, self.labels, self.words))
+    self.offsets.append(self.out.tell())
+
+  def close(self):
+    tables = marshal.dumps((self.labels[0], self.words[0], self.offsets))
+    self.out.write(tables)
+    self.out.write(footer_format.pack(self.offsets[-1], MAGIC))
+    self.out.close()
+
+def write_trees(trees, filename):
+  '''Write all of the trees to a file in the binary format.'''
+  out = BinaryTreebankWriter(filename)
+  for tree in trees:
+    out.add(tree)
+  out.close()
+
+class BinaryTreebank:
+  '''A treebank in the binary format.  Trees are only read and constructed
+  when they are requested, so any tree can be loaded directly.  Empty trees are
+  returned as None.  The file stays open until close is called, or the end of
+  a with block.
+
+  >>> import os, tempfile
+  >>> texts = ["(ROOT (NP (NNP Newspaper)))", "(ROOT (S (NP (PRP It)) (VP (VBZ is))))", "(ROOT (NP (NN paper)))"]
+  >>> trees = [tree_from_text(text) for text in texts]
+  >>> filename = tempfile.mktemp()
+  >>> write_trees(trees[:1] + [None] + trees[1:], filename)
+  >>> treebank = BinaryTreebank(filename)
+  >>> len(treebank)
+  4
+  >>> treebank[3]
+  (ROOT (NP (NN paper)))
+  >>> treebank[-2].word_yield()
+  'It is'
+  >>> for tree in treebank:
+  ...   print tree
+  (ROOT (NP (NNP Newspaper)))
+  None
+  (ROOT (S (NP (PRP It)) (VP (VBZ is))))
+  (ROOT (NP (NN paper)))
+  >>> treebank.close()
+  >>> with BinaryTreebank(filename) as treebank:
+  ...   print treebank[0]
+  (ROOT (NP (NNP Newspaper)))
+  >>> treebank.source.closed
+  True
+  >>> os.remove(filename)'''
+  def __init__(self, filename):
+    self.source = open(filename, 'rb')
+    if self.source.read(len(MAGIC)) != MAGIC:
+      self.close()
+      raise Exception("{} is not a binary treebank".format(filename))
+    self.source.seek(-footer_format.size, 2)
+    tables_offset, magic = footer_format.unpack(self.source.read(footer_format.size))
+    if magic != MAGIC:
+      self.close()
+      raise Exception("{} is incomplete".format(filename))
+    self.source.seek(tables_offset)
+    labels, self.words, self.offsets = marshal.load(self.source)
+    self.labels = [intern_label(label) for label in labels]
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def get_data(self, index):
+    '''Get the encoded form of a tree, without constructing it.'''
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError("Tree {} is not in the treebank".format(index))
+    self.source.seek(self.offsets[index])
+    return self.source.read(self.offsets[index + 1] - self.offsets[index])
+
+  def __getitem__(self, index):
+    data = self.get_data(index)
+    if len(data) == 0:
+      return None
+    return decode_tree(data, self.labels, self.words)
+
+  def __iter__(self):
+    for pos in xrange(len(self)):
+      yield self[pos]
+
+  def close(self):
+    self.source.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+if __name__ == '__main__':
+  print "Running doctest"
+  import doctest
+  doctest.testmod()
@@ -5,56 +5,109 @@
 import sys
 from collections import defaultdict
 import string
+import multiprocessing
 
 import head_finder
 
 # TODO: Look into semantic head finding (current is syntactically biased)
 
+def confusion_group_ids(gold_mentions, auto_mentions, gold_clusters, auto_clusters):
+	'''Find the groups of auto and gold clusters that are connected by shared
+	mentions, with a union-find over cluster ids.  Returns a list of (auto
+	cluster ids, gold cluster ids) for each group.
+
+	>>> gold_clusters = {0: [(0, 0, 1), (0, 3, 4)], 1: [(1, 0, 2)], 2: [(2, 0, 1)]}
+	>>> auto_clusters = {5: [(0, 0, 1)], 6: [(0, 3, 4), (1, 0, 2)], 7: [(3, 0, 1)]}
+	>>> gold_mentions = dict((m, c) for c in gold_clusters for m in gold_clusters[c])
+	>>> auto_mentions = dict((m, c) for c in auto_clusters for m in auto_clusters[c])
+	>>> sorted(confusion_group_ids(gold_mentions, auto_mentions, gold_clusters, auto_clusters))
+	[([], [2]), ([5, 6], [0, 1]), ([7], [])]'''
+	# Clusters are numbered with auto clusters first, and parent[i] is the
+	# cluster i is joined to, or i for the representative of a group
+	ids = []
+	positions = [{}, {}]
+	for is_gold, clusters in [(0, auto_clusters), (1, gold_clusters)]:
+		for cluster in clusters:
+			if len(clusters[cluster]) > 0:
+				positions[is_gold][cluster] = len(ids)
+				ids.append((is_gold, cluster))
+	parent = range(len(ids))
+
+	def find(pos):
+		while parent[pos] != pos:
+			parent[pos] = parent[parent[pos]]
+			pos = parent[pos]
+		return pos
+
+	# Join the clusters of each mention in both, going through the smaller set
+	# of mentions
+	auto_positions, gold_positions = positions
+	if len(auto_mentions) < len(gold_mentions):
+		pairs = [(auto_cluster, gold_mentions.get(mention)) for mention, auto_cluster in auto_mentions.iteritems()]
+	else:
+		pairs = [(auto_mentions.get(mention), gold_cluster) for mention, gold_cluster in gold_mentions.iteritems()]
+	for auto_cluster, gold_cluster in pairs:
+		if auto_cluster is not None and gold_cluster is not None:
+			first = find(auto_positions[auto_cluster])
+			second = find(gold_positions[gold_cluster])
+			if first < second:
+				parent[second] = first
+			elif second < first:
+				parent[first] = second
+
+	groups = {}
+	order = []
+	for pos in xrange(len(ids)):
+		root = find(pos)
+		if root not in groups:
+			groups[root] = ([], [])
+			order.append(root)
+		is_gold, cluster = ids[pos]
+		groups[root][is_gold].append(cluster)
+	return [groups[root] for root in order]
+
 def confusion_groups(gold_mentions, auto_mentions, gold_clusters, auto_clusters):
+	'''The groups of auto and gold clusters that are connected by shared
+	mentions, as a list of (auto clusters, gold clusters), where each cluster is
+	the collection of mentions from auto_clusters or gold_clusters (not a
+	copy).'''
 	groups = []
-	mentions = set()
-	for mention in gold_mentions:
-		mentions.add(mention)
-	for mention in auto_mentions:
-		mentions.add(mention)
-	while len(mentions) > 0:
-		# Choose a random mention and DFS to create the confusion group
-		auto = []
-		gold = []
-		seed = mentions.pop()
-		stack = []
-		seen_gold = set()
-		seen_auto = set()
-		if seed in gold_mentions:
-			stack.append((gold_mentions[seed], True))
-			seen_gold.add(stack[0][0])
-		else:
-			stack.append((auto_mentions[seed], False))
-			seen_auto.add(stack[0][0])
-
-		while len(stack) > 0:
-			cluster, is_gold = stack.pop()
-			if is_gold:
-				gold.append(set(gold_clusters[cluster]))
-				for mention in gold_clusters[cluster]:
-					auto_cluster = auto_mentions.get(mention)
-					if auto_cluster is not None:
-						if auto_cluster not in seen_auto:
-							stack.append((auto_cluster, False))
-							seen_auto.add(auto_cluster)
-					mentions.discard(mention)
-			else:
-				auto.append(set(auto_clusters[cluster]))
-				for mention in auto_clusters[cluster]:
-					gold_cluster = gold_mentions.get(mention)
-					if gold_cluster is not None:
-						if gold_cluster not in seen_gold:
-							stack.append((gold_cluster, True))
-							seen_gold.add(gold_cluster)
-					mentions.discard(mention)
-		groups.append((auto, gold))
+	for auto_ids, gold_ids in confusion_group_ids(gold_mentions, auto_mentions, gold_clusters, auto_clusters):
+		groups.append(([auto_clusters[cluster] for cluster in auto_ids], [gold_clusters[cluster] for cluster in gold_ids]))
 	return groups
 
+def part_confusion_group_ids(args):
+	gold_mentions, auto_mentions, gold_clusters, auto_clusters = args
+	return confusion_group_ids(gold_mentions, auto_mentions, gold_clusters, auto_clusters)
+
+def corpus_confusion_groups(gold, auto, processes=1):
+	'''Confusion groups for every part of a corpus, where gold and auto map doc
+	-> part -> info with mentions and clusters (as given by
+	coreference_reading).  Returns doc -> part -> the groups from
+	confusion_group_ids, for each part in auto.  With processes > 1 the parts
+	are grouped in parallel.'''
+	keys = []
+	args = []
+	for doc in auto:
+		for part in auto[doc]:
+			keys.append((doc, part))
+			gold_info = gold[doc][part]
+			auto_info = auto[doc][part]
+			# Plain dictionaries, so they can be sent to other processes
+			args.append((gold_info['mentions'], auto_info['mentions'],
+				dict(gold_info['clusters']), dict(auto_info['clusters'])))
+	if processes > 1:
+		pool = multiprocessing.Pool(processes)
+		results = pool.map(part_confusion_group_ids, args, 16)
+		pool.close()
+		pool.join()
+	else:
+		results = map(part_confusion_group_ids, args)
+	ans = defaultdict(dict)
+	for (doc, part), groups in zip(keys, results):
+		ans[doc][part] = groups
+	return ans
+
 def mention_head(mention, text, parses, heads, default_last=True):
 	sentence, start, end = mention
 	node = parses[sentence].get_nodes('lowest', start, end)
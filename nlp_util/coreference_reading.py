@@ -3,111 +3,139 @@
 # vim: set ts=2 sw=2 noet:
 
 import sys, os
-import pstree, treebanks, head_finder, render_tree
+import pstree, head_finder, render_tree, binary_treebank
 from collections import defaultdict
-from StringIO import StringIO
 import re
 import glob, fnmatch
+import cPickle
+import multiprocessing
 
-def read_conll_parses(lines):
-	in_file = StringIO(''.join(lines))
-	return treebanks.read_trees(in_file, treebanks.conll_read_tree)
+coref_re = re.compile("([(][0-9]*[)])|([(][0-9]*)|([0-9]*[)])|([|])")
 
-def read_conll_text(lines):
-	text = [[]]
-	for line in lines:
-		fields = line.strip().split()
-		if len(fields) == 0:
-			text.append([])
-		else:
-			text[-1].append(fields[3])
-	if len(text[-1]) == 0:
-		text.pop()
-	return text
-
-def read_conll_ner(lines):
-	info = {}
-	word = 0
-	sentence = 0
-	cur = []
-	for line in lines:
-		fields = line.strip().split()
-		if len(fields) >= 11:
-			ner_info = fields[10]
-			if '(' in ner_info and '*' in ner_info:
-				cur.append((ner_info[1:-1], sentence, word))
-			elif '(' in ner_info and ')' in ner_info:
-				info[sentence, word, word +1] = ner_info[1:-1]
-			elif ')' in ner_info and '*' in ner_info:
-				start = cur.pop()
-				if sentence != start[1]:
-					print >> sys.stderr, "Something mucked up", sentence, word, start
-				info[sentence, start[2], word +1] = start[0]
-		word += 1
-		if len(fields) == 0:
-			sentence += 1
-			word = 0
-	return info
+def read_conll_columns(lines, rtext=True, rparses=True, rclusters=True, rner=True):
+	'''Read the fields requested for a part in one pass over its lines,
+	splitting each line once.  Returns a dictionary with 'text', 'columns' (the
+	words, POS tags and parse bits of each sentence, for tree_from_conll),
+	'mentions', 'clusters' and 'ner', as given by the read_conll_* functions.
 
-def read_conll_coref(lines):
-	# Assumes:
-	#  - Reading a single part
-	#  - If duplicate mentions occur, use the first
-	regex = "([(][0-9]*[)])|([(][0-9]*)|([0-9]*[)])|([|])"
-	mentions = {} # (sentence, start, end+1) -> ID
-	clusters = defaultdict(lambda: []) # ID -> list of (sentence, start, end+1)s
-	unmatched_mentions = defaultdict(lambda: [])
+	>>> lines = """nw/wsj/00/wsj_0020  0  0  They  PRP  (TOP(S(NP*)  -  -  -  -  *  (ARG1*)  (0)
+	... nw/wsj/00/wsj_0020  0  1  left  VBD  (VP*))  -  -  -  -  *  (V*)  -
+	...
+	... nw/wsj/00/wsj_0020  0  0  Japan  NNP  (TOP(S(NP*)  -  -  -  -  (GPE*  *  (0
+	... nw/wsj/00/wsj_0020  0  1  Inc.  NNP  *)  -  -  -  -  *)  *  0)
+	... nw/wsj/00/wsj_0020  0  2  agreed  VBD  (VP*)))  -  -  -  -  *  *  -
+	... """.split('\\n')
+	>>> info = read_conll_columns([line + '\\n' for line in lines])
+	>>> info['text']
+	[['They', 'left'], ['Japan', 'Inc.', 'agreed']]
+	>>> info['columns'][0]
+	(['They', 'left'], ['PRP', 'VBD'], ['(TOP(S(NP*)', '(VP*))'])
+	>>> info['mentions']
+	{(1, 0, 2): 0, (0, 0, 1): 0}
+	>>> info['ner']
+	{(1, 0, 2): 'GPE'}'''
+	text = [[]]
+	columns = []
+	words = []
+	tags = []
+	parse_bits = []
+	# Coreference, with mentions as (sentence, start, end+1).  If duplicate
+	# mentions occur, the first is used.
+	mentions = {}
+	clusters = defaultdict(list)
+	unmatched_mentions = defaultdict(list)
+	ner = {}
+	ner_starts = []
 
 	sentence = 0
 	word = 0
 	line_no = 0
 	for line in lines:
 		line_no += 1
-		if len(line) > 0 and line[0] =='#':
+		if len(line) > 0 and line[0] == '#':
 			continue
-		line = line.strip()
-		if len(line) == 0:
+		fields = line.split()
+		if len(fields) == 0:
 			sentence += 1
 			word = 0
-			unmatched_mentions = defaultdict(lambda: [])
+			text.append([])
+			if len(words) > 0:
+				columns.append((words, tags, parse_bits))
+				words = []
+				tags = []
+				parse_bits = []
+			unmatched_mentions = defaultdict(list)
 			continue
-		fields = line.strip().split()
-		for triple in re.findall(regex, fields[-1]):
-			if triple[1] != '':
-				val = int(triple[1][1:])
-				unmatched_mentions[(sentence, val)].append(word)
-			elif triple[0] != '' or triple[2] != '':
-				start = word
-				val = -1
-				if triple[0] != '':
-					val = int(triple[0][1:-1])
-				else:
-					val = int(triple[2][:-1])
-					if (sentence, val) not in unmatched_mentions:
-###						print ''.join(lines[:20])
-###						print triple
-###						print fields
-###						print line
-###						print line_no, len(lines)
-###						raise Exception("Ending mention with no start: " + str(val))
-						print >> sys.stderr, "Ignoring a mention with no start", str(val), line.strip(), line_no
-						continue
-					if len(unmatched_mentions[(sentence, val)]) == 0:
-						print >> sys.stderr, "No other start available", str(val), line.strip(), line_no
-						continue
-					start = unmatched_mentions[(sentence, val)].pop()
-				end = word + 1
-				if (sentence, start, end) in mentions:
-					print >> sys.stderr, "Duplicate mention", sentence, start, end, val, mentions[sentence, start, end]
-				else:
-					mentions[sentence, start, end] = val
-					clusters[val].append((sentence, start, end))
+
+		if rtext:
+			text[-1].append(fields[3])
+		if rparses:
+			words.append(fields[3])
+			tags.append(fields[4])
+			parse_bits.append(fields[5])
+
+		if rner and len(fields) >= 11:
+			ner_info = fields[10]
+			if ner_info != '*':
+				if '(' in ner_info and '*' in ner_info:
+					ner_starts.append((ner_info[1:-1], sentence, word))
+				elif '(' in ner_info and ')' in ner_info:
+					ner[sentence, word, word + 1] = ner_info[1:-1]
+				elif ')' in ner_info and '*' in ner_info:
+					start = ner_starts.pop()
+					if sentence != start[1]:
+						print >> sys.stderr, "Something mucked up", sentence, word, start
+					ner[sentence, start[2], word + 1] = start[0]
+
+		if rclusters and fields[-1] != '-':
+			for triple in coref_re.findall(fields[-1]):
+				if triple[1] != '':
+					val = int(triple[1][1:])
+					unmatched_mentions[(sentence, val)].append(word)
+				elif triple[0] != '' or triple[2] != '':
+					start = word
+					val = -1
+					if triple[0] != '':
+						val = int(triple[0][1:-1])
+					else:
+						val = int(triple[2][:-1])
+						if (sentence, val) not in unmatched_mentions:
+							print >> sys.stderr, "Ignoring a mention with no start", str(val), line.strip(), line_no
+							continue
+						if len(unmatched_mentions[(sentence, val)]) == 0:
+							print >> sys.stderr, "No other start available", str(val), line.strip(), line_no
+							continue
+						start = unmatched_mentions[(sentence, val)].pop()
+					end = word + 1
+					if (sentence, start, end) in mentions:
+						print >> sys.stderr, "Duplicate mention", sentence, start, end, val, mentions[sentence, start, end]
+					else:
+						mentions[sentence, start, end] = val
+						clusters[val].append((sentence, start, end))
 		word += 1
+
+	if len(words) > 0:
+		columns.append((words, tags, parse_bits))
+	if len(text[-1]) == 0:
+		text.pop()
 	for key in unmatched_mentions:
 		if len(unmatched_mentions[key]) > 0:
 			print >> sys.stderr, "Mention started, but did not end ", str(unmatched_mentions[key])
-###			raise Exception("Mention started, but did not end " + str(unmatched_mentions[key]))
-	return mentions, clusters
+	return {'text': text, 'columns': columns, 'mentions': mentions, 'clusters': clusters, 'ner': ner}
+
+def read_conll_parses(lines):
+	columns = read_conll_columns(lines, False, True, False, False)['columns']
+	return [pstree.tree_from_conll(*sentence) for sentence in columns]
+
+def read_conll_text(lines):
+	return read_conll_columns(lines, True, False, False, False)['text']
+
+def read_conll_ner(lines):
+	return read_conll_columns(lines, False, False, False, True)['ner']
+
+def read_conll_coref(lines):
+	info = read_conll_columns(lines, False, False, True, False)
+	return info['mentions'], info['clusters']
 
 def read_stanford_coref(filename, gold_text):
 	'''Example (most of the file clipped):
@@ -442,19 +470,192 @@ def read_reconcile_coref(filename, gold_text):
 		text.pop()
 	return {'clusters': clusters, 'mentions': mentions, 'text': text}
 
-def read_conll_doc(filename, ans=None, rtext=True, rparses=True, rheads=True, rclusters=True, rner=True):
-	# Read entire file, inserting into a dictionary:
-	#  key - the #begin <blah> info
-	#  value - a dict, one entry per part, each entry contains:
-	#     - text
-	#     - parses
-	#     - heads
-	#     - coreference clusters
-	if ans is None:
-		ans = defaultdict(lambda: {})
+class LazySentences:
+	'''A list with a value for each sentence of a part, where the value for
+	sentence i is func(i), computed the first time it is used.'''
+	def __init__(self, length, func):
+		self.values = [None] * length
+		self.func = func
+
+	def __len__(self):
+		return len(self.values)
+
+	def __getitem__(self, index):
+		if type(index) == slice:
+			return [self[pos] for pos in xrange(*index.indices(len(self)))]
+		value = self.values[index]
+		if value is None:
+			value = self.func(index % len(self))
+			self.values[index] = value
+		return value
+
+	def __setitem__(self, index, value):
+		self.values[index] = value
+
+	def __iter__(self):
+		for index in xrange(len(self)):
+			yield self[index]
+
+class ConllPart:
+	'''The information for one part of a CoNLL file, used like a dictionary.
+	The lines are read in a single pass when a field is first used, giving the
+	text, mentions, clusters and ner for the whole part.  Parses and heads are
+	then built one sentence at a time, as they are used.  Only the fields
+	requested are available.
+
+	>>> lines = """nw/wsj/00/wsj_0020  0  0  They  PRP  (TOP(S(NP*)  -  -  -  -  *  (ARG1*)  (0)
+	... nw/wsj/00/wsj_0020  0  1  left  VBD  (VP*))  -  -  -  -  *  (V*)  -
+	...
+	... nw/wsj/00/wsj_0020  0  0  Japan  NNP  (TOP(S(NP*)  -  -  -  -  (GPE)  *  (0)
+	... nw/wsj/00/wsj_0020  0  1  agreed  VBD  (VP*)))  -  -  -  -  *  *  -
+	...
+	... """.split('\\n')
+	>>> info = ConllPart([line + '\\n' for line in lines], rner=False)
+	>>> sorted(info.keys())
+	['clusters', 'heads', 'mentions', 'parses', 'text']
+	>>> 'ner' in info
+	False
+	>>> print info['parses'][1]
+	(TOP (S (NP (NNP Japan)) (VP (VBD agreed))))
+	>>> info['parses'].values[0] is None
+	True
+	>>> info['heads'][1][(0, 2), 'S']
+	((1, 2), 'agreed', 'VBD')
+	>>> info['clusters'][0]
+	[(0, 0, 1), (1, 0, 1)]'''
+	def __init__(self, lines, rtext=True, rparses=True, rheads=True, rclusters=True, rner=True):
+		self.lines = lines
+		self.columns = None
+		self.encoded_parses = None
+		self.vocab = None
+		self.values = {}
+		self.fields = []
+		if rtext:
+			self.fields.append('text')
+		if rparses:
+			self.fields.append('parses')
+			if rheads:
+				self.fields.append('heads')
+		if rclusters:
+			self.fields += ['mentions', 'clusters']
+		if rner:
+			self.fields.append('ner')
+
+	def read_lines(self):
+		info = read_conll_columns(self.lines, 'text' in self.fields,
+			'parses' in self.fields, 'clusters' in self.fields, 'ner' in self.fields)
+		self.columns = info['columns']
+		for key in ['text', 'mentions', 'clusters', 'ner']:
+			if key in self.fields and key not in self.values:
+				self.values[key] = info[key]
+		self.lines = None
+
+	def use_values(self, values, encoded_parses=None, labels=None, words=None, heads=None):
+		'''Use fields that were read elsewhere (e.g. in another process) instead
+		of reading lines.  Parses are given flattened by
+		binary_treebank.encode_tree, and are built as they are used.  Heads, if
+		given, are the head maps already found for every sentence.'''
+		self.lines = None
+		self.values.update(values)
+		self.encoded_parses = encoded_parses
+		self.vocab = (labels, words)
+		if heads is not None:
+			self.values['heads'] = LazySentences(len(heads), self.find_heads)
+			self.values['heads'].values = heads
+
+	def read_parse(self, sentence):
+		if self.encoded_parses is not None:
+			return binary_treebank.decode_tree(self.encoded_parses[sentence], *self.vocab)
+		return pstree.tree_from_conll(*self.columns[sentence])
+
+	def find_heads(self, sentence):
+		return head_finder.pennconverter_find_heads(self['parses'][sentence])
+
+	def __getitem__(self, key):
+		if key in self.values:
+			return self.values[key]
+		if key not in self.fields:
+			raise KeyError(key)
+		if self.columns is None and self.lines is not None:
+			self.read_lines()
+		if self.columns is not None:
+			sentences = len(self.columns)
+		else:
+			sentences = len(self.encoded_parses)
+		if key == 'parses':
+			self.values['parses'] = LazySentences(sentences, self.read_parse)
+		elif key == 'heads':
+			self.values['heads'] = LazySentences(sentences, self.find_heads)
+		return self.values[key]
+
+	def __setitem__(self, key, value):
+		if key not in self.fields:
+			self.fields.append(key)
+		self.values[key] = value
+
+	def __contains__(self, key):
+		return key in self.fields
+
+	def __iter__(self):
+		return iter(self.fields)
+
+	def __len__(self):
+		return len(self.fields)
+
+	def keys(self):
+		return list(self.fields)
+
+	def items(self):
+		return [(key, self[key]) for key in self.fields]
+
+	def get(self, key, default=None):
+		if key in self.fields:
+			return self[key]
+		return default
+
+	def evaluate(self):
+		'''Compute every field, giving a plain dictionary.'''
+		ans = {}
+		for key in self.fields:
+			value = self[key]
+			if isinstance(value, LazySentences):
+				value = list(value)
+			ans[key] = value
+		return ans
+
+def generate_conll_parts(source, rtext=True, rparses=True, rheads=True, rclusters=True, rner=True):
+	'''Read a file (a filename or a file object), yielding (doc, part, info)
+	for each part as soon as it has been read, so only one part is in memory at
+	a time.  Info is a ConllPart, with the fields requested, as for
+	read_conll_doc.
+
+	>>> from StringIO import StringIO
+	>>> text = """#begin document (nw/wsj/00/wsj_0020); part 000
+	... nw/wsj/00/wsj_0020  0  0  They  PRP  (TOP(S(NP*)  -  -  -  -  *  (ARG1*)  (0)
+	... nw/wsj/00/wsj_0020  0  1  will  MD  (VP*  -  -  -  -  *  *  -
+	... nw/wsj/00/wsj_0020  0  2  remain  VB  (VP*))  remain  01  1  -  *  (V*)  -
+	... nw/wsj/00/wsj_0020  0  3  .  .  *))  -  -  -  -  *  *  -
+	...
+	... #end document
+	... #begin document (nw/wsj/00/wsj_0020); part 001
+	... nw/wsj/00/wsj_0020  1  0  Japan  NNP  (TOP(S(NP*)  -  -  -  -  (GPE)  *  (1)
+	... nw/wsj/00/wsj_0020  1  1  agreed  VBD  (VP*)))  -  -  -  -  *  *  -
+	...
+	... #end document
+	... """
+	>>> for doc, part, info in generate_conll_parts(StringIO(text), rheads=False):
+	...   print doc, part, info['text'], info['parses'][0], info['clusters'].items(), info['ner']
+	nw/wsj/00/wsj_0020 000 [['They', 'will', 'remain', '.']] (TOP (S (NP (PRP They)) (VP (MD will) (VP (VB remain))) (. .))) [(0, [(0, 0, 1)])] {}
+	nw/wsj/00/wsj_0020 001 [['Japan', 'agreed']] (TOP (S (NP (NNP Japan)) (VP (VBD agreed)))) [(1, [(0, 0, 1)])] {(0, 0, 1): 'GPE'}
+	>>> for doc, part, info in generate_conll_parts(StringIO(text), False, False, False, True, False):
+	...   print part, info.keys()
+	000 ['mentions', 'clusters']
+	001 ['mentions', 'clusters']'''
+	if type(source) == type(''):
+		source = open(source)
 	cur = []
 	keys = None
-	for line in open(filename):
+	for line in source:
 		if len(line) > 0 and line.startswith('#begin') or line.startswith('#end'):
 			if 'begin' in line:
 				desc = line.split()
@@ -467,39 +668,171 @@ def read_conll_doc(filename, ans=None, rtext=True, rparses=True, rheads=True, rc
 				if keys is None:
 					print >> sys.stderr, "Error reading conll file - invalid #begin statemen\n", line
 				else:
-					info = {}
-					if rtext:
-						info['text'] = read_conll_text(cur)
-					if rparses:
-						info['parses'] = read_conll_parses(cur)
-						if rheads:
-							info['heads'] = [head_finder.pennconverter_find_heads(parse) for parse in info['parses']]
-					if rclusters:
-						info['mentions'], info['clusters'] = read_conll_coref(cur)
-					if rner:
-						info['ner'] = read_conll_ner(cur)
-					ans[keys[0]][keys[1]] = info
+					yield keys[0], keys[1], ConllPart(cur, rtext, rparses, rheads, rclusters, rner)
 					keys = None
 			cur = []
 		else:
 			cur.append(line)
+
+def read_conll_doc(filename, ans=None, rtext=True, rparses=True, rheads=True, rclusters=True, rner=True):
+	# Read entire file, inserting into a dictionary:
+	#  key - the #begin <blah> info
+	#  value - a dict, one entry per part, each entry contains:
+	#     - text
+	#     - parses
+	#     - heads
+	#     - coreference clusters
+	# Each part is a ConllPart, so fields are only computed when they are used.
+	# To process one part at a time instead, use generate_conll_parts
+	if ans is None:
+		ans = defaultdict(lambda: {})
+	for doc, part, info in generate_conll_parts(filename, rtext, rparses, rheads, rclusters, rner):
+		ans[doc][part] = info
 	return ans
 
-def read_conll_gold_files(dir_prefix):
-	ans = defaultdict(lambda: {})
-	query = os.path.join(dir_prefix, '*/*/*/*gold_conll')
-	for filename in glob.glob(query):
-		read_conll_doc(filename, ans)
+def read_conll_file_parts(args):
+	# Read all parts of a file, in a form that can be sent between processes.
+	# Heads are found here, as that is most of the work.  Parses are sent
+	# flattened, as pickling trees node by node is slow, and are only built
+	# again if they are used.
+	filename, fields = args
+	labels, words = ([], {}), ([], {})
+	parts = []
+	for doc, part, info in generate_conll_parts(filename, *fields):
+		values = {}
+		for key in ['text', 'mentions', 'clusters', 'ner']:
+			if key in info:
+				values[key] = info[key]
+		parses = None
+		heads = None
+		if 'parses' in info:
+			parses = [binary_treebank.encode_tree(parse, labels, words) for parse in info['parses']]
+		if 'heads' in info:
+			heads = list(info['heads'])
+		parts.append((doc, part, values, parses, heads))
+	return parts, labels[0], words[0]
+
+def read_conll_files(filenames, ans=None, processes=1, rtext=True, rparses=True, rheads=True, rclusters=True, rner=True):
+	# Read several files into the same doc -> part dictionary as read_conll_doc.
+	# With processes > 1 files are read in parallel, but the results are added
+	# in the order of filenames, and each part is a ConllPart, so the output does
+	# not depend on the number of processes.
+	if ans is None:
+		ans = defaultdict(lambda: {})
+	fields = (rtext, rparses, rheads, rclusters, rner)
+	if processes <= 1:
+		for filename in filenames:
+			read_conll_doc(filename, ans, *fields)
+		return ans
+
+	pool = multiprocessing.Pool(processes)
+	jobs = [(filename, fields) for filename in filenames]
+	for parts, labels, words in pool.imap(read_conll_file_parts, jobs):
+		labels = [pstree.intern_label(label) for label in labels]
+		for doc, part, values, parses, heads in parts:
+			info = ConllPart(None, *fields)
+			info.use_values(values, parses, labels, words, heads)
+			ans[doc][part] = info
+	pool.close()
+	pool.join()
 	return ans
 
+def read_conll_gold_files(dir_prefix, processes=1):
+	query = os.path.join(dir_prefix, '*/*/*/*gold_conll')
+	return read_conll_files(sorted(glob.glob(query)), None, processes)
+
 def read_conll_coref_system_output(filename, ans=None):
 	return read_conll_doc(filename, ans, False, False, False, True)
 
+CONLL_INDEX_VERSION = 1
+
+class ConllIndex:
+	'''A map from document names (e.g. bn/voa/02/voa_0220) to the CoNLL files
+	for them under a directory, found with a single walk of the directory.  A
+	file's document name is its path relative to the directory, up to the first
+	'.' in the filename.  If a cache filename is given the index is saved there,
+	and later loaded instead of walking the directory, as long as no directory
+	in it has been modified since.
+
+	>>> import tempfile, shutil
+	>>> dir_prefix = tempfile.mkdtemp()
+	>>> os.makedirs(os.path.join(dir_prefix, 'nw', 'wsj', '00'))
+	>>> for name in ['wsj_0020.v4_gold_conll', 'wsj_0020.v4_auto_conll', 'wsj_0021.v4_gold_conll']:
+	...   open(os.path.join(dir_prefix, 'nw', 'wsj', '00', name), 'w').close()
+	>>> index = ConllIndex(dir_prefix, cache=os.path.join(dir_prefix, 'index'))
+	>>> [os.path.basename(path) for path in index.lookup('nw/wsj/00/wsj_0020')]
+	['wsj_0020.v4_gold_conll']
+	>>> ConllIndex(dir_prefix, cache=os.path.join(dir_prefix, 'index')).files == index.files
+	True
+	>>> shutil.rmtree(dir_prefix)'''
+	def __init__(self, dir_prefix, suffix='gold_conll', cache=None):
+		self.dir_prefix = os.path.abspath(dir_prefix)
+		self.suffix = suffix
+		if cache is not None and self.load(cache):
+			return
+		self.build()
+		if cache is not None:
+			self.save(cache)
+
+	def build(self):
+		self.files = {}
+		# Directory -> modification time, changed when a file is added or removed
+		self.mtimes = {}
+		for root, dirnames, filenames in os.walk(self.dir_prefix):
+			self.mtimes[root] = os.stat(root).st_mtime
+			for filename in fnmatch.filter(filenames, '*' + self.suffix):
+				name = os.path.join(os.path.relpath(root, self.dir_prefix), filename.split('.')[0])
+				self.files.setdefault(os.path.normpath(name), []).append(os.path.join(root, filename))
+		for name in self.files:
+			self.files[name].sort()
+
+	def is_current(self):
+		for directory, mtime in self.mtimes.iteritems():
+			if not os.path.isdir(directory) or os.stat(directory).st_mtime != mtime:
+				return False
+		return True
+
+	def load(self, cache):
+		try:
+			data = cPickle.load(open(cache, 'rb'))
+		except Exception:
+			return False
+		if data[:3] != (CONLL_INDEX_VERSION, self.dir_prefix, self.suffix):
+			return False
+		self.mtimes, self.files = data[3:]
+		return self.is_current()
+
+	def save(self, cache):
+		# Written under a temporary name so that other readers never see a partial file
+		tmp_path = "{}.{}.tmp".format(cache, os.getpid())
+		out = open(tmp_path, 'wb')
+		cPickle.dump((CONLL_INDEX_VERSION, self.dir_prefix, self.suffix, self.mtimes, self.files), out, 2)
+		out.close()
+		os.rename(tmp_path, cache)
+
+	def lookup(self, name):
+		'''The files for the given document name.'''
+		return self.files.get(os.path.normpath(name), [])
+
+# (directory, suffix) -> ConllIndex, so each directory is only walked once
+conll_indexes = {}
+
+def conll_index(dir_prefix, suffix='gold_conll', cache=None):
+	'''The index of files under dir_prefix, built (or loaded from cache) the
+	first time it is requested.'''
+	key = (os.path.abspath(dir_prefix), suffix)
+	if key not in conll_indexes:
+		conll_indexes[key] = ConllIndex(dir_prefix, suffix, cache)
+	return conll_indexes[key]
+
 def read_conll_matching_file(dir_prefix, filename, ans=None):
+	# Read the file for the document under dir_prefix, unless it is already in
+	# ans, using the index of the directory
 	if ans is None:
 		ans = defaultdict(lambda: {})
-	query = os.path.join(dir_prefix, filename + '*gold_conll')
-	filenames = glob.glob(query)
+	if filename in ans:
+		return ans
+	filenames = conll_index(dir_prefix).lookup(filename)
 	if len(filenames) == 1:
 		read_conll_doc(filenames[0], ans)
 	else:
@@ -516,13 +849,25 @@ def read_conll_matching_files(conll_docs, dir_prefix):
 		ans = read_conll_matching_file(dir_prefix, filename, ans)
 	return ans
 
-def read_conll_all(dir_prefix, suffix="auto_conll"):
-	ans = None
+def find_conll_files(dir_prefix, suffix="auto_conll"):
+	# All files under dir_prefix with the given suffix, in a fixed order
+	ans = []
 	for root, dirnames, filenames in os.walk(dir_prefix):
 		for filename in fnmatch.filter(filenames, '*' + suffix):
-			ans = read_conll_doc(os.path.join(root, filename), ans)
+			ans.append(os.path.join(root, filename))
+	ans.sort()
 	return ans
 
+def generate_conll_all(dir_prefix, suffix="auto_conll", rtext=True, rparses=True, rheads=True, rclusters=True, rner=True):
+	# Yield (doc, part, info) for every part of every file under dir_prefix,
+	# without keeping the corpus in memory
+	for filename in find_conll_files(dir_prefix, suffix):
+		for ans in generate_conll_parts(filename, rtext, rparses, rheads, rclusters, rner):
+			yield ans
+
+def read_conll_all(dir_prefix, suffix="auto_conll", processes=1):
+	return read_conll_files(find_conll_files(dir_prefix, suffix), None, processes)
+
 def read_conll_scorer_output(text):
 	'''
 
@@ -17,63 +17,47 @@ ANSI_WHITE = 15
 ANSI_YELLOW = 3
 ANSI_RED = 1
 
-def match_boundaries(gold_mention_set, auto_mention_set, auto_mentions, auto_clusters, auto_cluster_set, text, parses, heads):
-	# Apply changes for cases where the difference is only leading or trailing punctuation
+def trim_mention(text, mention):
+	# Remove a leading "the" and trailing "'s", and leading or trailing
+	# punctuation, keeping at least one word
+	sentence, start, end = mention
+	words = text[sentence]
+	while (end - start > 1 and
+	       (words[start] == "the" or
+	       (len(words[start]) == 1 and
+	       words[start][0] not in string.letters))):
+		start += 1
+	while (end - start > 1 and
+	       (words[end - 1] == "'s" or
+	       (len(words[end - 1]) == 1 and
+	       words[end - 1][0] not in string.letters))):
+		end -= 1
+	return (sentence, start, end)
+
+def match_trimmed_mentions(unique_to_gold, unique_to_auto, text):
+	'''Map system mentions to gold mentions that are the same once trimmed.  Gold
+	mentions are grouped by their trimmed boundaries, so each system mention is
+	a single lookup.  When several gold mentions trim to the same span the last
+	is used, and the rest are not matched to anything else.
+
+	>>> text = [['the', 'big', 'dog', ',', 'ran'], ['Sam', "'s"]]
+	>>> gold = set([(0, 1, 3), (1, 0, 1)])
+	>>> auto = set([(0, 0, 4), (1, 0, 2), (0, 4, 5)])
+	>>> sorted(match_trimmed_mentions(gold, auto, text).items())
+	[((0, 0, 4), (0, 1, 3)), ((1, 0, 2), (1, 0, 1))]'''
+	gold_by_span = defaultdict(lambda: [])
+	for gmention in unique_to_gold:
+		gold_by_span[trim_mention(text, gmention)].append(gmention)
 	mapping = {}
-	used_gold = set()
-	unique_to_gold = gold_mention_set.difference(auto_mention_set)
-	unique_to_auto =  auto_mention_set.difference(gold_mention_set)
 	for amention in unique_to_auto:
-		sentence, astart, aend = amention
-		while (aend - astart > 1 and
-		       (text[sentence][astart] == "the" or
-		       (len(text[sentence][astart]) == 1 and
-		       text[sentence][astart][0] not in string.letters))):
-			astart += 1
-		while (aend - astart > 1 and
-		       (text[sentence][aend - 1] == "'s" or
-		       (len(text[sentence][aend - 1]) == 1 and
-		       text[sentence][aend - 1][0] not in string.letters))):
-			aend -= 1
-		for gmention in unique_to_gold:
-			gsentence, gstart, gend = gmention
-			if sentence != gsentence or gmention in used_gold:
-				continue
-			while (gend - gstart > 1 and
-			       (text[sentence][gstart] == "the" or
-			       (len(text[sentence][gstart]) == 1 and
-			       text[sentence][gstart][0] not in string.letters))):
-				gstart += 1
-			while (gend - gstart > 1 and
-			       (text[sentence][gend - 1] == "'s" or
-			       (len(text[sentence][gend - 1]) == 1 and
-			       text[sentence][gend - 1][0] not in string.letters))):
-				gend -= 1
-			if astart == gstart and aend == gend:
-				mapping[amention] = gmention
-				used_gold.add(gmention)
-	# Apply mapping to create new auto_mention_set
-	for mention in mapping:
-		auto_mention_set.remove(mention)
-		auto_mention_set.add(mapping[mention])
-		cluster_id = auto_mentions.pop(mention)
-		auto_mentions[mapping[mention]] = cluster_id
-		auto_clusters[cluster_id].remove(mention)
-		auto_clusters[cluster_id].append(mapping[mention])
-		to_remove = None
-		for cluster in auto_cluster_set:
-			if mention in cluster:
-				to_remove = cluster
-		auto_cluster_set.remove(to_remove)
-		ncluster = []
-		for mention2 in to_remove:
-			if mention2 == mention:
-				mention2 = mapping[mention]
-			ncluster.append(mention2)
-		ncluster = tuple(ncluster)
-		auto_cluster_set.add(ncluster)
-
-	# Create a mapping based on heads
+		gmentions = gold_by_span.pop(trim_mention(text, amention), None)
+		if gmentions is not None:
+			mapping[amention] = gmentions[-1]
+	return mapping
+
+def match_head_mentions(gold_mention_set, auto_mention_set, text, parses, heads):
+	# Map system mentions to gold mentions where they are the only unmatched
+	# mentions with a given head
 	head_dict = defaultdict(lambda: {'auto': [], 'gold': []})
 	for mention in auto_mention_set.difference(gold_mention_set):
 		sentence, start, end = mention
@@ -96,8 +80,11 @@ def match_boundaries(gold_mention_set, auto_mention_set, auto_mentions, auto_clu
 		gmentions = head_dict[head]['gold']
 		if len(amentions) == 1 and len(gmentions) == 1:
 			mapping[amentions[0]] = gmentions[0]
+	return mapping
 
-	# Apply mapping to create new auto_mention_set
+def remap_mentions(mapping, auto_mention_set, auto_mentions, auto_clusters, auto_cluster_set, cluster_index):
+	# Replace system mentions, updating all of the representations of the system
+	# output, and cluster_index, which maps each mention to its cluster tuple
 	for mention in mapping:
 		auto_mention_set.remove(mention)
 		auto_mention_set.add(mapping[mention])
@@ -105,10 +92,7 @@ def match_boundaries(gold_mention_set, auto_mention_set, auto_mentions, auto_clu
 		auto_mentions[mapping[mention]] = cluster_id
 		auto_clusters[cluster_id].remove(mention)
 		auto_clusters[cluster_id].append(mapping[mention])
-		to_remove = None
-		for cluster in auto_cluster_set:
-			if mention in cluster:
-				to_remove = cluster
+		to_remove = cluster_index.pop(mention)
 		auto_cluster_set.remove(to_remove)
 		ncluster = []
 		for mention2 in to_remove:
@@ -117,6 +101,23 @@ def match_boundaries(gold_mention_set, auto_mention_set, auto_mentions, auto_clu
 			ncluster.append(mention2)
 		ncluster = tuple(ncluster)
 		auto_cluster_set.add(ncluster)
+		for mention2 in ncluster:
+			cluster_index[mention2] = ncluster
+
+def match_boundaries(gold_mention_set, auto_mention_set, auto_mentions, auto_clusters, auto_cluster_set, text, parses, heads):
+	# Apply changes for cases where the difference is only leading or trailing punctuation
+	cluster_index = {}
+	for cluster in auto_cluster_set:
+		for mention in cluster:
+			cluster_index[mention] = cluster
+	unique_to_gold = gold_mention_set.difference(auto_mention_set)
+	unique_to_auto =  auto_mention_set.difference(gold_mention_set)
+	mapping = match_trimmed_mentions(unique_to_gold, unique_to_auto, text)
+	remap_mentions(mapping, auto_mention_set, auto_mentions, auto_clusters, auto_cluster_set, cluster_index)
+
+	# Create a mapping based on heads
+	mapping = match_head_mentions(gold_mention_set, auto_mention_set, text, parses, heads)
+	remap_mentions(mapping, auto_mention_set, auto_mentions, auto_clusters, auto_cluster_set, cluster_index)
 
 def print_conll_style_part(out, text, mentions, doc, part):
 	doc_str = doc
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 noet:
+
+'''Coreference evaluation metrics (MUC, B-cubed, CEAFm, CEAFe and BLANC),
+calculated directly from clusters, following the definitions used by version
+8 of the CoNLL reference scorer (Pradhan et al., 2014).  Mentions must match
+exactly.  Counts for each part are summed over a corpus before scores are
+calculated, as the reference scorer does.  Results map each metric to
+[precision, recall, F-score] as fractions (not the percentages the scorer
+prints), the same form as coreference_reading.read_conll_scorer_output.
+
+The metrics have been checked against the worked example in Pradhan et al.
+(2014), below, but not against the reference scorer's totals on OntoNotes.
+To check them on a corpus, run the reference scorer and compare its output
+with scorer_differences.
+
+The example from Pradhan et al. (2014), with key {a, b, c} {d, e, f, g} and
+response {a, b} {c, d} {f, g, h, i}:
+
+>>> key = {0: [(0, 0, 1), (0, 1, 2), (0, 2, 3)], 1: [(0, 3, 4), (0, 4, 5), (0, 5, 6), (0, 6, 7)]}
+>>> response = {0: [(0, 0, 1), (0, 1, 2)], 1: [(0, 2, 3), (0, 3, 4)], 2: [(0, 5, 6), (0, 6, 7), (0, 7, 8), (0, 8, 9)]}
+>>> results = scores_from_counts(part_counts(key, response))
+>>> for metric in ['mentions', 'muc', 'bcub', 'ceafm', 'ceafe', 'blanc']:
+...   print metric, ' '.join(['%.1f' % (100 * value) for value in results[metric]])
+mentions 75.0 85.7 80.0
+muc 40.0 40.0 40.0
+bcub 50.0 41.7 45.5
+ceafm 50.0 57.1 53.3
+ceafe 43.3 65.0 52.0
+blanc 32.5 44.4 36.8'''
+
+import multiprocessing
+from collections import defaultdict
+
+import coreference
+
+def mention_map(clusters):
+	'''Mention -> cluster id.'''
+	ans = {}
+	for cluster in clusters:
+		for mention in clusters[cluster]:
+			ans[mention] = cluster
+	return ans
+
+def max_assignment(weights):
+	'''The largest total weight of a one-to-one assignment of rows to columns,
+	for a matrix (a list of rows) with no more rows than columns, found with the
+	Hungarian algorithm in O(rows^2 * columns).
+
+	>>> max_assignment([[0.8, 0.4, 0.0], [0.0, 1/3.0, 0.5]])
+	1.3
+	>>> max_assignment([[1, 2], [2, 4]])
+	5'''
+	rows = len(weights)
+	cols = len(weights[0])
+	# Minimise cost = -weight, with potentials u (rows) and v (columns), and 1
+	# based positions, where column 0 is a dummy
+	u = [0] * (rows + 1)
+	v = [0] * (cols + 1)
+	matched = [0] * (cols + 1)
+	way = [0] * (cols + 1)
+	for row in xrange(1, rows + 1):
+		matched[0] = row
+		col0 = 0
+		minv = [float('inf')] * (cols + 1)
+		used = [False] * (cols + 1)
+		while True:
+			used[col0] = True
+			row0 = matched[col0]
+			delta = float('inf')
+			col1 = 0
+			row_weights = weights[row0 - 1]
+			for col in xrange(1, cols + 1):
+				if not used[col]:
+					cur = -row_weights[col - 1] - u[row0] - v[col]
+					if cur < minv[col]:
+						minv[col] = cur
+						way[col] = col0
+					if minv[col] < delta:
+						delta = minv[col]
+						col1 = col
+			for col in xrange(cols + 1):
+				if used[col]:
+					u[matched[col]] += delta
+					v[col] -= delta
+				else:
+					minv[col] -= delta
+			col0 = col1
+			if matched[col0] == 0:
+				break
+		while col0 != 0:
+			col1 = way[col0]
+			matched[col0] = matched[col1]
+			col0 = col1
+	return sum([weights[matched[col] - 1][col - 1] for col in xrange(1, cols + 1) if matched[col] != 0])
+
+def ceaf_similarity(key_clusters, response_clusters, key_ids, response_ids, overlap, phi):
+	# The best total similarity for an alignment of the given clusters
+	if len(key_ids) == 0 or len(response_ids) == 0:
+		return 0
+	weights = []
+	for key_id in key_ids:
+		key_overlap = overlap[key_id]
+		weights.append([phi(key_overlap.get(response_id, 0), len(key_clusters[key_id]), len(response_clusters[response_id])) for response_id in response_ids])
+	if len(weights) == 1 and len(weights[0]) == 1:
+		return weights[0][0]
+	if len(weights) > len(weights[0]):
+		weights = [list(column) for column in zip(*weights)]
+	return max_assignment(weights)
+
+def ceafm_phi(common, key_size, response_size):
+	return common
+
+def ceafe_phi(common, key_size, response_size):
+	return 2.0 * common / (key_size + response_size)
+
+def pairs(count):
+	return count * (count - 1) / 2
+
+def part_counts(key_clusters, response_clusters):
+	'''Counts for every metric for one part, as a dictionary from metric name
+	to (recall numerator, recall denominator, precision numerator, precision
+	denominator), except for blanc, which has the number of coreference links
+	that match, are in the key, and are in the response, then the same for
+	non-coreference links.  Clusters map ids to lists of mentions.'''
+	key_clusters = dict((cluster, mentions) for cluster, mentions in key_clusters.iteritems() if len(mentions) > 0)
+	response_clusters = dict((cluster, mentions) for cluster, mentions in response_clusters.iteritems() if len(mentions) > 0)
+	key_mentions = mention_map(key_clusters)
+	response_mentions = mention_map(response_clusters)
+
+	# Key cluster -> response cluster -> number of mentions in both
+	overlap = defaultdict(lambda: defaultdict(int))
+	common = 0
+	for mention, key_cluster in key_mentions.iteritems():
+		response_cluster = response_mentions.get(mention)
+		if response_cluster is not None:
+			overlap[key_cluster][response_cluster] += 1
+			common += 1
+	reverse_overlap = defaultdict(dict)
+	for key_cluster in overlap:
+		for response_cluster, count in overlap[key_cluster].iteritems():
+			reverse_overlap[response_cluster][key_cluster] = count
+
+	ans = {}
+	ans['mentions'] = (common, len(key_mentions), common, len(response_mentions))
+
+	# MUC, where mentions missing from the other side are each a partition
+	muc = [0, 0, 0, 0]
+	for clusters, overlaps, offset in [(key_clusters, overlap, 0), (response_clusters, reverse_overlap, 2)]:
+		for cluster, mentions in clusters.iteritems():
+			shared = overlaps.get(cluster, {})
+			partitions = len(shared) + len(mentions) - sum(shared.itervalues())
+			muc[offset] += len(mentions) - partitions
+			muc[offset + 1] += len(mentions) - 1
+	ans['muc'] = tuple(muc)
+
+	# B-cubed
+	bcub = [0.0, len(key_mentions), 0.0, len(response_mentions)]
+	for clusters, overlaps, offset in [(key_clusters, overlap, 0), (response_clusters, reverse_overlap, 2)]:
+		for cluster, shared in overlaps.iteritems():
+			bcub[offset] += sum([count * count for count in shared.itervalues()]) / float(len(clusters[cluster]))
+	ans['bcub'] = tuple(bcub)
+
+	# CEAF, aligning clusters within each group of clusters that share
+	# mentions, as clusters in different groups have no similarity
+	ceafm = 0
+	ceafe = 0.0
+	for response_ids, key_ids in coreference.confusion_group_ids(key_mentions, response_mentions, key_clusters, response_clusters):
+		ceafm += ceaf_similarity(key_clusters, response_clusters, key_ids, response_ids, overlap, ceafm_phi)
+		ceafe += ceaf_similarity(key_clusters, response_clusters, key_ids, response_ids, overlap, ceafe_phi)
+	ans['ceafm'] = (ceafm, len(key_mentions), ceafm, len(response_mentions))
+	ans['ceafe'] = (ceafe, len(key_clusters), ceafe, len(response_clusters))
+
+	# BLANC, with non-coreference links only counted as matching between
+	# mentions that are in both the key and response
+	key_coref = sum([pairs(len(mentions)) for mentions in key_clusters.itervalues()])
+	response_coref = sum([pairs(len(mentions)) for mentions in response_clusters.itervalues()])
+	common_coref = sum([pairs(count) for shared in overlap.itervalues() for count in shared.itervalues()])
+	key_common_coref = sum([pairs(sum(shared.itervalues())) for shared in overlap.itervalues()])
+	response_common_coref = sum([pairs(sum(shared.itervalues())) for shared in reverse_overlap.itervalues()])
+	key_noncoref = pairs(len(key_mentions)) - key_coref
+	response_noncoref = pairs(len(response_mentions)) - response_coref
+	common_noncoref = pairs(common) - key_common_coref - response_common_coref + common_coref
+	ans['blanc'] = (common_coref, key_coref, response_coref, common_noncoref, key_noncoref, response_noncoref)
+	return ans
+
+def add_counts(total, counts):
+	'''Add the counts for a part to the running total (which is modified).'''
+	for metric in counts:
+		if metric in total:
+			total[metric] = tuple([a + b for a, b in zip(total[metric], counts[metric])])
+		else:
+			total[metric] = counts[metric]
+	return total
+
+def prf(recall_num, recall_den, precision_num, precision_den):
+	recall = 0.0
+	if recall_den > 0:
+		recall = recall_num / float(recall_den)
+	precision = 0.0
+	if precision_den > 0:
+		precision = precision_num / float(precision_den)
+	fscore = 0.0
+	if precision + recall > 0:
+		fscore = 2 * precision * recall / (precision + recall)
+	return [precision, recall, fscore]
+
+def blanc_prf(common_coref, key_coref, response_coref, common_noncoref, key_noncoref, response_noncoref):
+	# When neither the key nor the response has one type of link, only the
+	# other type is scored (Luo et al., 2014)
+	coref = prf(common_coref, key_coref, common_coref, response_coref)
+	noncoref = prf(common_noncoref, key_noncoref, common_noncoref, response_noncoref)
+	if key_coref == 0 and response_coref == 0:
+		return noncoref
+	if key_noncoref == 0 and response_noncoref == 0:
+		return coref
+	return [(coref[i] + noncoref[i]) / 2 for i in xrange(3)]
+
+def scores_from_counts(counts):
+	'''Precision, recall and F-score for each metric, as fractions (not
+	percentages), from the (summed) counts, with the CoNLL score, the average of
+	MUC, B-cubed and CEAFe.'''
+	results = {}
+	for metric in counts:
+		if metric == 'blanc':
+			results[metric] = blanc_prf(*counts[metric])
+		else:
+			results[metric] = prf(*counts[metric])
+	if 'ceafe' in results and 'muc' in results and 'bcub' in results:
+		results['conll'] = [0, 0, 0]
+		for metric in ['muc', 'bcub', 'ceafe']:
+			for i in xrange(3):
+				results['conll'][i] += results[metric][i] / 3.0
+	return results
+
+def part_counts_for_args(args):
+	return part_counts(*args)
+
+def corpus_counts(gold, auto, processes=1):
+	'''Summed counts for a corpus, where gold and auto map doc -> part -> info
+	with clusters (as given by coreference_reading).  Every gold part is scored,
+	with no clusters for parts missing from auto.  With processes > 1 parts are
+	scored in parallel.'''
+	args = []
+	for doc in sorted(gold):
+		for part in sorted(gold[doc]):
+			auto_clusters = {}
+			if doc in auto and part in auto[doc]:
+				auto_clusters = auto[doc][part]['clusters']
+			# Plain dictionaries, so they can be sent to other processes
+			args.append((dict(gold[doc][part]['clusters']), dict(auto_clusters)))
+	if processes > 1:
+		pool = multiprocessing.Pool(processes)
+		results = pool.imap(part_counts_for_args, args, 16)
+	else:
+		results = (part_counts(*arg) for arg in args)
+	total = {}
+	for counts in results:
+		add_counts(total, counts)
+	if processes > 1:
+		pool.close()
+		pool.join()
+	return total
+
+def score_corpus(gold, auto, processes=1):
+	'''Precision, recall and F-score for every metric, for a corpus, as
+	fractions (multiply by 100 for the percentages the scorer prints).'''
+	return scores_from_counts(corpus_counts(gold, auto, processes))
+
+def scorer_differences(results, scorer_results, tolerance=1e-6):
+	'''Compare results with those of the reference scorer, as given by
+	read_conll_scorer_output (both as fractions).  Returns a list of (metric,
+	index, value, scorer value) for each value that differs by more than the
+	tolerance, where index 0 is precision, 1 is recall and 2 is F-score.
+
+	>>> results = {'muc': [0.4, 0.4, 0.4], 'bcub': [0.5, 0.4166, 0.4545]}
+	>>> scorer_differences(results, {'muc': [0.4, 0.4, 0.4]})
+	[]
+	>>> scorer_differences(results, {'muc': [0.4, 0.5, 0.4444], 'bcub': [0.5, 0.4166, 0.4545]})
+	[('muc', 1, 0.4, 0.5), ('muc', 2, 0.4, 0.4444)]'''
+	ans = []
+	for metric in sorted(scorer_results):
+		if metric not in results:
+			continue
+		for index in xrange(3):
+			value = results[metric][index]
+			scorer_value = scorer_results[metric][index]
+			if abs(value - scorer_value) > tolerance:
+				ans.append((metric, index, value, scorer_value))
+	return ans
+
+if __name__ == "__main__":
+	print "Running doctest"
+	import doctest
+	doctest.testmod()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+'''Corpus level precision, recall and F-score from per-sentence counts, and
+significance tests for the difference between two systems scored on the same
+sentences.  Counts are kept in NumPy arrays, so that scores for many resampled
+corpora can be calculated together with vectorised sums.'''
+
+import numpy
+
+import nlp_eval
+
+METRICS = {'p': 0, 'r': 1, 'f': 2}
+
+class Counts:
+	'''Per-sentence bracket counts for one system: the number of matching
+	brackets, brackets in the gold tree, brackets in the test tree, and crossing
+	brackets.
+
+	>>> counts = Counts([2, 3, 0], [4, 3, 2], [3, 3, 0], [1, 0, 0])
+	>>> len(counts)
+	3
+	>>> counts.totals()
+	(5, 9, 6, 1)
+	>>> counts.prf()
+	(0.8333333333333334, 0.5555555555555556, 0.6666666666666666)
+	>>> counts.select([0, 0]).totals()
+	(4, 8, 6, 2)'''
+	def __init__(self, match, gold, test, crossing=None):
+		self.match = numpy.asarray(match, dtype=numpy.int64)
+		self.gold = numpy.asarray(gold, dtype=numpy.int64)
+		self.test = numpy.asarray(test, dtype=numpy.int64)
+		if crossing is None:
+			crossing = numpy.zeros(len(self.match), dtype=numpy.int64)
+		self.crossing = numpy.asarray(crossing, dtype=numpy.int64)
+		if not (len(self.match) == len(self.gold) == len(self.test) == len(self.crossing)):
+			raise Exception("Counts must be given for the same number of sentences")
+
+	def __len__(self):
+		return len(self.match)
+
+	def matrix(self):
+		'''The counts as a matrix with a row for each sentence, and columns for
+		match, gold and test.'''
+		return numpy.column_stack((self.match, self.gold, self.test))
+
+	def select(self, ids):
+		'''Counts for the given sentences (a list of positions, or a boolean
+		mask).'''
+		return Counts(self.match[ids], self.gold[ids], self.test[ids], self.crossing[ids])
+
+	def totals(self):
+		return (int(self.match.sum()), int(self.gold.sum()), int(self.test.sum()), int(self.crossing.sum()))
+
+	def prf(self):
+		'''Precision, recall and F-score for the whole corpus, as calc_prf gives
+		for the total counts.'''
+		match, gold, test, crossing = self.totals()
+		return nlp_eval.calc_prf(match, gold, test)
+
+def calc_prf_arrays(match, gold, test):
+	'''Calculate precision, recall and F-score for arrays of counts, giving the
+	same values as nlp_eval.calc_prf for each position.
+
+	>>> p, r, f = calc_prf_arrays([0, 0, 0, 0, 2], [0, 0, 4, 4, 2], [0, 5, 5, 0, 8])
+	>>> print p
+	[1.   0.   0.   0.   0.25]
+	>>> print r
+	[1. 1. 0. 0. 1.]
+	>>> print f
+	[1.  0.  0.  0.  0.4]'''
+	match = numpy.asarray(match, dtype=numpy.float64)
+	gold = numpy.asarray(gold, dtype=numpy.float64)
+	test = numpy.asarray(test, dtype=numpy.float64)
+	no_gold = gold == 0
+	zero = no_gold | (test == 0) | (match == 0)
+	# Avoid dividing by zero for the cases that are set afterwards
+	safe_test = numpy.where(zero, 1.0, test)
+	safe_gold = numpy.where(zero, 1.0, gold)
+	p = numpy.where(zero, 0.0, match / safe_test)
+	r = numpy.where(zero, 0.0, match / safe_gold)
+	f = numpy.where(zero, 0.0, 2 * match / (safe_test + safe_gold))
+	r[no_gold] = 1.0
+	both_empty = no_gold & (test == 0)
+	p[both_empty] = 1.0
+	f[both_empty] = 1.0
+	return p, r, f
+
+def check_paired(first, second):
+	if len(first) != len(second):
+		raise Exception("Systems must be scored on the same sentences ({} vs. {})".format(len(first), len(second)))
+
+def score_difference(first, second, metric='f'):
+	'''The score of the first system minus the score of the second.'''
+	return first.prf()[METRICS[metric]] - second.prf()[METRICS[metric]]
+
+def resampled_differences(first, second, weights, metric):
+	# Differences in score for corpora where sentence i is counted weights[k, i]
+	# times in corpus k, for both systems
+	totals = numpy.dot(weights, numpy.hstack((first.matrix(), second.matrix())))
+	first_scores = calc_prf_arrays(totals[:, 0], totals[:, 1], totals[:, 2])
+	second_scores = calc_prf_arrays(totals[:, 3], totals[:, 4], totals[:, 5])
+	return first_scores[METRICS[metric]] - second_scores[METRICS[metric]]
+
+def paired_bootstrap(first, second, samples=10000, metric='f', seed=0, chunk_size=1000):
+	'''Test whether the first system is better than the second, with a paired
+	bootstrap over sentences.  Corpora are sampled with replacement, and the
+	p-value is the fraction of samples where the difference in score is at least
+	twice the observed difference (Berg-Kirkpatrick et al., 2012).  Returns the
+	observed difference and the p-value.
+
+	>>> first = Counts([8, 9, 7, 9] * 10, [10] * 40, [10] * 40)
+	>>> second = Counts([6, 7, 7, 5] * 10, [10] * 40, [10] * 40)
+	>>> difference, p_value = paired_bootstrap(first, second, 1000)
+	>>> print round(difference, 3), p_value < 0.01
+	0.2 True
+	>>> difference, p_value = paired_bootstrap(first, first, 1000)
+	>>> print difference, p_value
+	0.0 1.0'''
+	check_paired(first, second)
+	observed = score_difference(first, second, metric)
+	rand = numpy.random.RandomState(seed)
+	length = len(first)
+	exceeded = 0
+	for start in xrange(0, samples, chunk_size):
+		count = min(chunk_size, samples - start)
+		# Count how many times each sentence is drawn for each sample, by
+		# offsetting the draws for sample k by k * length
+		draws = rand.randint(0, length, size=(count, length))
+		draws += (numpy.arange(count) * length)[:, None]
+		weights = numpy.bincount(draws.ravel(), minlength=count * length).reshape(count, length)
+		differences = resampled_differences(first, second, weights, metric)
+		exceeded += int((differences >= 2 * observed - 1e-12).sum())
+	return observed, exceeded / float(samples)
+
+def approximate_randomization(first, second, samples=10000, metric='f', seed=0, chunk_size=1000):
+	'''Test whether the two systems differ, by randomly swapping the outputs of
+	the systems for each sentence.  The p-value is the fraction of shuffles
+	that give an absolute difference in score at least as large as the observed
+	one, with one added to the count and the number of shuffles (Noreen, 1989).
+	Returns the observed difference and the p-value.
+
+	>>> first = Counts([8, 9, 7, 9] * 10, [10] * 40, [10] * 40)
+	>>> second = Counts([6, 7, 7, 5] * 10, [10] * 40, [10] * 40)
+	>>> difference, p_value = approximate_randomization(first, second, 1000)
+	>>> print round(difference, 3), p_value < 0.01
+	0.2 True
+	>>> difference, p_value = approximate_randomization(first, first, 1000)
+	>>> print difference, p_value
+	0.0 1.0'''
+	check_paired(first, second)
+	observed = score_difference(first, second, metric)
+	rand = numpy.random.RandomState(seed)
+	first_matrix = first.matrix()
+	second_matrix = second.matrix()
+	first_totals = first_matrix.sum(axis=0)
+	second_totals = second_matrix.sum(axis=0)
+	change = second_matrix - first_matrix
+	exceeded = 0
+	for start in xrange(0, samples, chunk_size):
+		count = min(chunk_size, samples - start)
+		swaps = rand.randint(0, 2, size=(count, len(first)))
+		moved = numpy.dot(swaps, change)
+		totals = first_totals + moved
+		other = second_totals - moved
+		first_scores = calc_prf_arrays(totals[:, 0], totals[:, 1], totals[:, 2])
+		second_scores = calc_prf_arrays(other[:, 0], other[:, 1], other[:, 2])
+		differences = first_scores[METRICS[metric]] - second_scores[METRICS[metric]]
+		# Allow for rounding error when comparing with the observed difference
+		exceeded += int((numpy.abs(differences) >= abs(observed) - 1e-12).sum())
+	return observed, (exceeded + 1) / float(samples + 1)
+
+if __name__ == "__main__":
+	print "Running doctest"
+	import doctest
+	doctest.testmod()
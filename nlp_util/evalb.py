@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 noet:
+
+'''Score parses against gold trees in the style of EVALB, returning the
+results as data.  tools/evalb.py is a command line interface to this, and
+training code can call evaluate directly to avoid starting a process for
+each evaluation.'''
+
+import itertools, multiprocessing
+
+import pstree, nlp_eval, treebanks, parse_errors, frozen_tree
+
+options = {
+	# 'option_word': ((valid options or type), default, "Long description"),
+	# Scoring modification
+	"include_POS_in_score": [bool, False,
+		"Include POS tags in overall score"],
+	"include_unparsed_in_score": [bool, True,
+		"Include missed sentences in overall score"],
+	"summary_cutoffs": [[int], [40],
+		"Cutoff lengths for summaries, each gives a summary of the sentences"
+		"with at most that many words"],
+	# Tree modification
+	"remove_trivial_unaries": [bool, True,
+		"Remove unaries that go from a label to iself,"
+		"e.g. (NP (NP (NNP it))) has one"],
+	"remove_function_labels": [bool, True,
+		"Remove function labels, e.g. NP-TMP, remove the -TMP part"],
+	"homogenise_top_label": [bool, True,
+		"Homogenise the top labels, so all are ROOT"],
+	"labels_to_remove": [[str],
+		["TOP", "ROOT", "S1", "-NONE-", ",", ":", "``", "''", "."],
+		"Remove nodes with the given labels, keep subtrees, but remove"
+		"parents that now have a span of size 0"],
+	"words_to_remove": [[str], [],
+		"Remove nodes with the given words, and do as for labels"],
+	"equivalent_labels": [[(str, str)], [("ADVP", "PRT")],
+		"Labels to treat as equivalent"],
+	"equivalent_words": [[(str, str)], [],
+		"Words to treat as equivalent"],
+	# Execution
+	"processes": [int, 1,
+		"Number of processes to score sentences with, output is the same as for"
+		"a single process"],
+}
+
+def option_values(given=None):
+	'''The value of every option, with those in given (a dictionary from option
+	name to value) replacing the defaults.
+
+	>>> values = option_values({'include_POS_in_score': True})
+	>>> values['include_POS_in_score'], values['summary_cutoffs']
+	(True, [40])'''
+	values = dict((name, options[name][1]) for name in options)
+	if given is not None:
+		for name in given:
+			if name not in options:
+				raise Exception("Unknown option: {}".format(name))
+			values[name] = given[name]
+	return values
+
+def parse_option_value(kind, value):
+	'''Convert the text of an option's value to the option's kind.
+
+	>>> parse_option_value([int], "10,40")
+	[10, 40]
+	>>> print parse_option_value(('ptb', 'ontonotes'), 'ontonotes')
+	ontonotes'''
+	if kind == bool:
+		return value.lower() in ['true', 'yes', '1']
+	elif kind == int or kind == str:
+		return kind(value)
+	elif type(kind) == list and kind[0] in [int, str]:
+		# Lists of simple values are given separated by commas
+		return [kind[0](part) for part in value.split(',') if part != '']
+	elif type(kind) != tuple or value not in kind:
+		raise Exception("Invalid value: {}".format(value))
+	return value
+
+def build_tree(item):
+	'''Get a tree to modify from the text of a PTB tree, a tree (which is
+	copied, or thawed if it is a FrozenTree), or "Empty" / None for a missing
+	parse.  Text that is blank or an
+	empty tree, such as the (()) EVALB uses for a failed parse, is also missing.
+
+	>>> print build_tree("(())"), build_tree("  "), build_tree("(ROOT (NN it))")
+	None None (ROOT (NN it))'''
+	if item is None or item == "Empty":
+		return None
+	if isinstance(item, pstree.PSTree):
+		return item.clone()
+	if isinstance(item, frozen_tree.FrozenTree):
+		return item.thaw()
+	# The same test for an empty tree as when reading PTB files
+	if item.strip() == '' or '()' in item:
+		return None
+	tree = pstree.tree_from_text(item, True, True)
+	treebanks.ptb_cleaning(tree)
+	return tree
+
+def modify_tree(tree, options, apply_equivalences=True):
+	'''Modify a tree as per the options.  The original evalb script only
+	applied the label and word equivalences to gold trees, so scoring leaves
+	them out for test trees to keep the same scores.'''
+	if options["remove_function_labels"]:
+		treebanks.remove_function_tags(tree)
+	if options["homogenise_top_label"]:
+		tree = treebanks.homogenise_tree(tree)
+	if len(options['labels_to_remove']) > 0:
+		treebanks.remove_nodes(tree, lambda(n): n.label in options['labels_to_remove'], True, True)
+	if len(options['words_to_remove']) > 0:
+		treebanks.remove_nodes(tree, lambda(n): n.word in options['words_to_remove'], True, True)
+	if apply_equivalences and len(options['equivalent_labels']) > 0:
+		for node in tree:
+			for pair in options['equivalent_labels']:
+				if node.label in pair:
+					node.label = pair[0]
+	if apply_equivalences and len(options['equivalent_words']) > 0:
+		for node in tree:
+			for pair in options['equivalent_words']:
+				if node.word in pair:
+					node.word = pair[0]
+	if options['remove_trivial_unaries']:
+		treebanks.remove_trivial_unaries(tree)
+	return tree
+
+def prepare_gold(item, options):
+	'''Build and modify a gold tree, and get the brackets test trees are compared
+	with.  Returns the modified tree (as a FrozenTree, as it is kept while every
+	system is scored), its length before modification, the brackets, and the
+	number of brackets before modification, which is the gold count for a
+	sentence with no parse (as in the original evalb script).
+
+	>>> gold = prepare_gold("(ROOT (S (NP (NNP Ms.) (NNP Haag)) (VP (VBZ plays)) (. .)))", option_values())
+	>>> gold[0], gold[1], gold[3]
+	((ROOT (S (NP (NNP Ms.) (NNP Haag)) (VP (VBZ plays)))), 4, 3)'''
+	gold_tree = build_tree(item)
+	gwords = len(gold_tree.word_yield().split())
+	unparsed_gcount = parse_errors.count_brackets(parse_errors.get_brackets(gold_tree, True),
+		include_terminals=options['include_POS_in_score'])
+	gold_tree = frozen_tree.freeze(modify_tree(gold_tree, options))
+	return gold_tree, gwords, parse_errors.get_brackets(gold_tree, True), unparsed_gcount
+
+def score_test(sent_id, gold, test_item, options):
+	'''Modify and score one test tree against a prepared gold tree.  Returns a
+	dictionary of the counts and scores (as percentages) for the sentence, or
+	of just the id, length and an error message if it could not be scored.'''
+	gold_tree, gwords, gold_brackets, unparsed_gcount = gold
+	test_tree = build_tree(test_item)
+
+	# Coverage error
+	if test_tree is None:
+		return {'id': sent_id, 'length': gwords, 'p': 0.0, 'r': 0.0, 'f': 0.0,
+			'match': 0, 'gold': unparsed_gcount, 'test': 0, 'crossing': 0, 'POS': 0,
+			'POS_acc': 0.0}
+
+	# Simple check for consistency
+	twords = len(test_tree.word_yield().split())
+	if twords != gwords:
+		return {'id': sent_id, 'length': gwords,
+			'error': "Sentence lengths do not match: {} {}".format(twords, gwords)}
+
+	# Modify as per options, then score
+	test_tree = modify_tree(test_tree, options, False)
+	match, gcount, tcount, crossing, POS = parse_errors.counts_for_prf(test_tree,
+		gold_tree, include_terminals=options['include_POS_in_score'],
+		gold_brackets=gold_brackets)
+	POS = twords - POS
+	p, r, f = nlp_eval.calc_prf(match, gcount, tcount)
+	return {'id': sent_id, 'length': gwords, 'p': p * 100, 'r': r * 100,
+		'f': f * 100, 'match': match, 'gold': gcount, 'test': tcount,
+		'crossing': crossing, 'POS': POS, 'POS_acc': 100.0 * POS / twords}
+
+def score_pair(args):
+	'''Score every system's tree for one sentence, giving a list of score_test
+	results.  This only depends on its arguments, so sentences can be scored in
+	any process.'''
+	sent_id, gold_item, test_items, options = args
+	gold = prepare_gold(gold_item, options)
+	return [score_test(sent_id, gold, test_item, options) for test_item in test_items]
+
+def score_sentences(gold_items, test_items, options):
+	'''Yield a list of score_test results for each sentence, in order, where
+	test_items gives a tuple of items for each sentence, one for each system.
+	Items are as for build_tree, and options are option values (as returned by
+	option_values).'''
+	args = itertools.izip(itertools.count(1), gold_items, test_items,
+		itertools.repeat(options))
+	if options['processes'] > 1:
+		pool = multiprocessing.Pool(options['processes'])
+		for sentence in pool.imap(score_pair, args, 64):
+			yield sentence
+		pool.close()
+		pool.join()
+	else:
+		for sentence in itertools.imap(score_pair, args):
+			yield sentence
+
+def add_to_summary(summary, result):
+	if 'error' in result:
+		summary.add_unscored(result['length'])
+	else:
+		summary.add(result['length'], result['match'], result['gold'],
+			result['test'], result['crossing'], result['POS'])
+
+def evaluate(gold_trees, test_trees, options=None):
+	'''Score test trees against gold trees, which may be given as trees (which
+	are not modified), the text of PTB trees, or None for missing parses.
+	options is a dictionary from option name to value, for any that differ from
+	the defaults.  Returns a dictionary with the results for each sentence
+	(from score_test), the summary for all sentences, and a list of (cutoff,
+	summary) for the summary_cutoffs.
+
+	>>> gold = ["(ROOT (S (NP (NNP Ms.) (NNP Haag)) (VP (VBZ plays) (NP (NNP Elianti))) (. .)))"]
+	>>> test = [pstree.tree_from_text("(ROOT (S (NP (NNP Ms.)) (VP (NNP Haag) (VBZ plays) (NP (NNP Elianti))) (. .)))")]
+	>>> results = evaluate(gold, test)
+	>>> print "{p:.2f} {r:.2f} {f:.2f}".format(**results['summary'])
+	50.00 50.00 50.00
+	>>> results['sentences'][0]['match'], results['sentences'][0]['POS']
+	(2, 5)
+	>>> results['cutoffs'][0][0], results['cutoffs'][0][1]['sentences']
+	(40, 1)
+	>>> results = evaluate(gold, ["(())"])
+	>>> results['summary']['sentences'], results['summary']['parsed']
+	(1, 0)
+	>>> print test[0]
+	(ROOT (S (NP (NNP Ms.)) (VP (NNP Haag) (VBZ plays) (NP (NNP Elianti))) (. .)))'''
+	options = option_values(options)
+	summary = nlp_eval.EvalbSummary(options['include_unparsed_in_score'],
+		options['summary_cutoffs'])
+	sentences = []
+	test_items = itertools.izip(test_trees)
+	for sentence in score_sentences(gold_trees, test_items, options):
+		result = sentence[0]
+		sentences.append(result)
+		add_to_summary(summary, result)
+	return {'sentences': sentences, 'summary': summary.summary(),
+		'cutoffs': [(cutoff, cutoff_summary.summary()) for cutoff, cutoff_summary in summary.cutoffs]}
+
+if __name__ == "__main__":
+	print "Running doctest"
+	import doctest
+	doctest.testmod()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+'''A read-only tree stored as parallel arrays, for code that looks at a large
+number of trees without changing them (e.g. scoring, once trees have been
+modified).  A whole tree takes a handful of arrays, rather than several
+objects per node.'''
+
+from array import array
+
+import pstree
+
+# Labels are stored as ids that are shared by all frozen trees
+label_ids = {}
+labels = []
+def label_id(label):
+  '''Return the id for the given label, adding it if it is new.'''
+  ans = label_ids.get(label)
+  if ans is None:
+    ans = len(labels)
+    label_ids[label] = ans
+    labels.append(label)
+  return ans
+
+class FrozenTree(object):
+  '''Phrase Structure Tree stored as parallel arrays.  Nodes are referred to by
+  their position in a pre-order traversal, so the root is node 0.  The
+  children of node i are children[child_offsets[i]:child_offsets[i + 1]].
+
+  >>> tree = pstree.tree_from_text("(ROOT (S (NP-SBJ (NNP Ms.) (NNP Haag) ) (VP (VBZ plays) (NP (NNP Elianti) )) (. .) ))")
+  >>> frozen = freeze(tree)
+  >>> print frozen
+  (ROOT (S (NP-SBJ (NNP Ms.) (NNP Haag)) (VP (VBZ plays) (NP (NNP Elianti))) (. .)))
+  >>> print frozen.word_yield()
+  Ms. Haag plays Elianti .
+  >>> frozen.word_yield((1, 3), True)
+  ['Haag', 'plays']
+  >>> [frozen.label(node) for node in frozen.postorder()]
+  ['NNP', 'NNP', 'NP-SBJ', 'VBZ', 'NNP', 'NP', 'VP', '.', 'S', 'ROOT']
+  >>> frozen.production_list() == tree.production_list()
+  True
+  >>> [frozen.label(node) for node in frozen.get_nodes('all', 2, 4)]
+  ['VP']
+  >>> [frozen.label(node) for node in frozen.get_nodes('all', 0, 5)]
+  ['ROOT', 'S']
+  >>> frozen.label(frozen.get_nodes('lowest', 0, 5))
+  'S'
+  >>> print frozen.thaw()
+  (ROOT (S (NP-SBJ (NNP Ms.) (NNP Haag)) (VP (VBZ plays) (NP (NNP Elianti))) (. .)))
+
+  Labels are stored as text when pickling, as ids differ between processes:
+  >>> import cPickle
+  >>> print cPickle.loads(cPickle.dumps(frozen))
+  (ROOT (S (NP-SBJ (NNP Ms.) (NNP Haag)) (VP (VBZ plays) (NP (NNP Elianti))) (. .)))
+  '''
+  __slots__ = ['label_ids', 'starts', 'ends', 'word_starts', 'word_ends', 'parents', 'child_offsets', 'children', 'words']
+
+  def __init__(self):
+    self.label_ids = array('i')
+    self.starts = array('i')
+    self.ends = array('i')
+    self.word_starts = array('i')
+    self.word_ends = array('i')
+    self.parents = array('i')
+    self.child_offsets = array('i', [0])
+    self.children = array('i')
+    self.words = []
+
+  def __getstate__(self):
+    state = [getattr(self, name) for name in FrozenTree.__slots__]
+    state[0] = [labels[label] for label in self.label_ids]
+    return tuple(state)
+
+  def __setstate__(self, state):
+    for name, value in zip(FrozenTree.__slots__, state):
+      setattr(self, name, value)
+    self.label_ids = array('i', [label_id(label) for label in state[0]])
+
+  def __len__(self):
+    return len(self.label_ids)
+
+  def label(self, node):
+    return labels[self.label_ids[node]]
+
+  def span(self, node):
+    return (self.starts[node], self.ends[node])
+
+  def wordspan(self, node):
+    return (self.word_starts[node], self.word_ends[node])
+
+  def word(self, node):
+    return self.words[node]
+
+  def parent(self, node):
+    '''The parent of the given node, or None for the root.'''
+    ans = self.parents[node]
+    return None if ans < 0 else ans
+
+  def subtrees(self, node):
+    return self.children[self.child_offsets[node]:self.child_offsets[node + 1]]
+
+  def is_terminal(self, node):
+    return self.child_offsets[node] == self.child_offsets[node + 1]
+
+  def is_trace(self, node):
+    return self.label(node) == pstree.TRACE_LABEL
+
+  def preorder(self):
+    return xrange(len(self.label_ids))
+
+  def postorder(self):
+    # Visit children right to left, then reverse
+    ans = []
+    stack = [0]
+    while len(stack) > 0:
+      node = stack.pop()
+      ans.append(node)
+      stack.extend(self.subtrees(node))
+    ans.reverse()
+    return ans
+
+  def __iter__(self):
+    return iter(self.preorder())
+
+  def __repr__(self):
+    '''Return a bracket notation style representation of the tree.'''
+    ans = []
+    # -1 marks where a bracket is closed
+    stack = [0]
+    while len(stack) > 0:
+      node = stack.pop()
+      if node < 0:
+        ans.append(')')
+      elif self.is_terminal(node):
+        ans.append(' (' + self.label(node) + ' ' + self.words[node] + ')')
+      else:
+        ans.append(' (' + self.label(node))
+        stack.append(-1)
+        stack.extend(reversed(self.subtrees(node)))
+    return ''.join(ans)[1:]
+
+  def word_yield(self, span=None, as_list=False):
+    '''Return the words at terminal nodes, either as a space separated string,
+    or as a list.'''
+    ans = []
+    for node in self.preorder():
+      if self.is_terminal(node) and self.words[node] is not None:
+        if span is None or span[0] <= self.starts[node] < span[1]:
+          ans.append(self.words[node])
+    if not as_list:
+      ans = ' '.join(ans)
+    return ans
+
+  def production_list(self):
+    '''Get a list of productions as:
+    (node label, node span, ((subtree1, end1), (subtree2, end2)...))'''
+    ans = []
+    for node in self.preorder():
+      if not self.is_terminal(node):
+        subs = tuple([(self.label(sub), self.ends[sub]) for sub in self.subtrees(node)])
+        ans.append((self.label(node), self.span(node), subs))
+    return ans
+
+  def get_nodes(self, request='all', start=-1, end=-1):
+    '''Get the node(s) that have a given span, as for PSTree.get_nodes
+    (including which subtrees are skipped).  Nodes are returned as ids.'''
+    if request not in ['highest', 'lowest', 'all']:
+      raise Exception("%s is not a valid request" % str(request))
+    if request == 'lowest' and start < 0 and end < 0:
+      raise Exception("Lowest is not well defined when both ends are wildcards")
+
+    ans = []
+    # Nodes are visited twice, before and after their subtrees
+    stack = [(0, False)]
+    while len(stack) > 0:
+      node, done = stack.pop()
+      matches = (self.starts[node] == start or start < 0) and (self.ends[node] == end or end < 0)
+      if not done:
+        if request == 'highest' and matches:
+          return node
+        stack.append((node, True))
+        for subtree in reversed(self.subtrees(node)):
+          # Skip subtrees with no overlapping range
+          if 0 < end <= self.starts[subtree] or self.ends[subtree] < start:
+            continue
+          stack.append((subtree, False))
+      elif matches:
+        if request == 'lowest':
+          return node
+        ans.append(node)
+    if request == 'all':
+      ans.reverse()
+      return ans
+    return None
+
+  def thaw(self):
+    '''Construct the equivalent PSTree.'''
+    nodes = []
+    for node in self.preorder():
+      nodes.append(pstree.PSTree(self.words[node], self.label(node), self.span(node)))
+      nodes[-1].wordspan = self.wordspan(node)
+      parent = self.parents[node]
+      if parent >= 0:
+        nodes[-1].parent = nodes[parent]
+        nodes[parent].subtrees.append(nodes[-1])
+    return nodes[0]
+
+def freeze(tree):
+  '''Construct a FrozenTree from the given PSTree (treating it as the root).
+  The PSTree is not kept, so it can be freed once it is no longer needed.'''
+  ans = FrozenTree()
+  ids = {}
+  nodes = []
+  for node in tree:
+    ids[id(node)] = len(nodes)
+    nodes.append(node)
+    ans.label_ids.append(label_id(node.label))
+    ans.starts.append(node.span[0])
+    ans.ends.append(node.span[1])
+    ans.word_starts.append(node.wordspan[0])
+    ans.word_ends.append(node.wordspan[1])
+    ans.parents.append(-1 if node is tree else ids[id(node.parent)])
+    ans.words.append(node.word)
+  # Children are only known once every node has an id
+  for node in nodes:
+    ans.children.extend([ids[id(sub)] for sub in node.subtrees])
+    ans.child_offsets.append(len(ans.children))
+  return ans
+
+if __name__ == '__main__':
+  print "Running doctest"
+  import doctest
+  doctest.testmod()
@@ -2,7 +2,7 @@
 
 import sys, re
 
-import treebanks
+import pstree, treebanks
 
 #TODO: Handle other langauges
 
@@ -75,17 +75,69 @@ collins_mapping_table = {
   'META': ('right', [])
 }
 
-def add_head(head_map, tree, head):
+class HeadMap(dict):
+  '''The heads found for a tree.  As a dictionary it maps (span, label) to
+  (head span, head word, head label), with coindexation removed from labels.
+  The head of each node of the tree is also stored by node, so get_head can
+  find it with a single lookup.  Only the dictionary part is kept when pickling,
+  as nodes are not the same objects once unpickled.  get_head also accepts a
+  plain dictionary, as head maps used to be.
+
+  >>> import cPickle
+  >>> tree = pstree.tree_from_text("(ROOT (S (NP (NNP Ms.) (NNP Haag)) (VP (VBZ plays))))")
+  >>> head_map = pennconverter_find_heads(tree)
+  >>> copy = cPickle.loads(cPickle.dumps(head_map))
+  >>> copy == head_map, len(copy.nodes)
+  (True, 0)
+  >>> get_head(copy, tree.subtrees[0].subtrees[0])
+  ((1, 2), 'Haag', 'NNP')
+  >>> get_head(dict(head_map), tree)
+  ((2, 3), 'plays', 'VBZ')'''
+  def __init__(self, items=()):
+    dict.__init__(self, items)
+    # id of node -> (node, head), holding the node so the id is not reused
+    self.nodes = {}
+
+  def __reduce__(self):
+    return (HeadMap, (self.items(),))
+
+def coindexation_free_label(tree):
+  label = tree.label
+  if label[-1:].isdigit():
+    label = treebanks.intern_label(treebanks.remove_coindexation_from_label(label))
+  return label
+
+def last_word(tree):
+  # The last word in the tree, as in tree.word_yield(as_list=True)[-1]
+  stack = [tree]
+  while len(stack) > 0:
+    node = stack.pop()
+    if len(node.subtrees) > 0:
+      stack.extend(node.subtrees)
+    elif node.word is not None:
+      return node.word
+  return None
+
+def add_head(head_map, tree, head, label=None):
   if log: print "Added", tree.span, tree, head
-  tree_repr = (tree.span, tree.label)
-  head_map[tree_repr] = head
+  if label is None:
+    label = tree.label
+  head_map[tree.span, label] = head
+  nodes = getattr(head_map, 'nodes', None)
+  if nodes is not None:
+    nodes[id(tree)] = (tree, head)
 
 def get_head(head_map, tree, amend_for_trace=False):
   if not amend_for_trace:
+    nodes = getattr(head_map, 'nodes', None)
+    if nodes is not None:
+      entry = nodes.get(id(tree))
+      if entry is not None and entry[0] is tree:
+        return entry[1]
     tree_repr = (tree.span, tree.label)
     if tree_repr in head_map:
       return head_map[tree_repr]
-  tree_repr = (tree.wordspan, treebanks.remove_coindexation(tree, False).label)
+  tree_repr = (tree.wordspan, coindexation_free_label(tree))
   if tree_repr in head_map:
     return head_map[tree_repr]
   tree_repr = (tree.wordspan, treebanks.split_label_type_and_function(tree.label)[0])
@@ -97,7 +149,7 @@ def get_signature(head_map, tree):
   tree_repr = (tree.span, tree.label)
   if tree_repr in head_map:
     return tree_repr
-  tree_repr = (tree.wordspan, treebanks.remove_coindexation(tree, False).label)
+  tree_repr = (tree.wordspan, coindexation_free_label(tree))
   if tree_repr in head_map:
     return tree_repr
   tree_repr = (tree.wordspan, treebanks.split_label_type_and_function(tree.label)[0])
@@ -105,80 +157,82 @@ def get_signature(head_map, tree):
     return tree_repr
   return None
 
-def add_if_match(tree, options, head_map, reverse=False):
-  for i in xrange(len(tree.subtrees)):
-    if reverse:
-      i = len(tree.subtrees) - i - 1
-    subtree = tree.subtrees[i]
-    if subtree.label in options:
-      add_head(head_map, tree, get_head(head_map, subtree))
-      return True
-  return False
+# The rules below find the head of a node from the labels of its subtrees
+# (without coindexation) and the heads of its subtrees
 
-def collins_NP(tree, head_map):
+def head_if_match(labels, heads, options, reverse=False):
+  positions = xrange(len(labels))
+  if reverse:
+    positions = reversed(positions)
+  for i in positions:
+    if labels[i] in options:
+      return heads[i]
+  return None
+
+def collins_NP(labels, heads):
   #TODO:todo handle NML properly
   #TODO:todo Extra cases for NPs:
 ### Ignore the row for NPs -- I use a special set of rules for this. For these
-### I initially remove ADJPs, QPs, and also NPs which dominate a possesive 
-### (tagged POS, e.g.  (NP (NP the man 's) telescope ) becomes 
-### (NP the man 's telescope)). These are recovered as a post-processing stage 
+### I initially remove ADJPs, QPs, and also NPs which dominate a possesive
+### (tagged POS, e.g.  (NP (NP the man 's) telescope ) becomes
+### (NP the man 's telescope)). These are recovered as a post-processing stage
 ### after parsing. The following rules are then used to recover the NP head:
 
-  if get_head(head_map, tree.subtrees[-1])[2] == 'POS':
-    add_head(head_map, tree, get_head(head_map, tree.subtrees[-1]))
-    return
-  if add_if_match(tree, {'NN', 'NNP', 'NNPS', 'NNS', 'NX', 'POS', 'JJR'}, head_map, True):
-    return
-  if add_if_match(tree, {'NP', 'NML'}, head_map):
-    return
-  if add_if_match(tree, {'$', 'ADJP', 'PRN'}, head_map, True):
-    return
-  if add_if_match(tree, {'CD'}, head_map, True):
-    return
-  if add_if_match(tree, {'JJ', 'JJS', 'RB', 'QP'}, head_map, True):
-    return
-  add_head(head_map, tree, get_head(head_map, tree.subtrees[-1]))
-
-def pennconverter_PP(tree, head_map):
+  if heads[-1][2] == 'POS':
+    return heads[-1]
+  for options, reverse in collins_NP_rules:
+    head = head_if_match(labels, heads, options, reverse)
+    if head is not None:
+      return head
+  return heads[-1]
+
+collins_NP_rules = [
+  ({'NN', 'NNP', 'NNPS', 'NNS', 'NX', 'POS', 'JJR'}, True),
+  ({'NP', 'NML'}, False),
+  ({'$', 'ADJP', 'PRN'}, True),
+  ({'CD'}, True),
+  ({'JJ', 'JJS', 'RB', 'QP'}, True)
+]
+
+def pennconverter_PP(labels, heads):
 # ( 'left', [('first non-punctuation after preposition)']),
   prep_seen = False
-  for subtree in tree.subtrees:
-    if subtree.label in {'IN', 'TO', 'RP'}:
+  for i in xrange(len(labels)):
+    if labels[i] in {'IN', 'TO', 'RP'}:
       prep_seen = True
-    elif prep_seen and re.match(non_punct_re, subtree.label) is not None:
-      add_head(head_map, tree, get_head(head_map, subtree))
-      return
-  add_head(head_map, tree, get_head(head_map, tree.subtrees[0]))
+    elif prep_seen and non_punct_re.match(labels[i]) is not None:
+      return heads[i]
+  return heads[0]
 
-def pennconverter_is_coord(node):
+def pennconverter_is_coord(node, label, labels):
   if len(node.subtrees) < 2:
     return False
 
   # If it contains a conjunction other than '[n]either', use that
-  for sub in node.subtrees:
-    if sub.label == 'CONJP':
+  for sub, sub_label in zip(node.subtrees, labels):
+    if sub_label == 'CONJP':
       return True
-    if sub.label == 'CC' and sub.word not in {'either', 'neither'}:
+    if sub_label == 'CC' and sub.word not in {'either', 'neither'}:
       return True
 
-  if node.label == 'UCP':
+  if label == 'UCP':
     return True
 
   commas = False
-  for sub in node.subtrees:
-    if sub.label in {',', ':'}:
+  for sub_label in labels:
+    if sub_label in {',', ':'}:
       commas = True
-        
-  if node.label in {"NP", "NX", "NML", "NAC"}:
+
+  if label in {"NP", "NX", "NML", "NAC"}:
     # Check for appositives
     if not commas:
       return False
     np_children = 0
-    for sub in node.subtrees:
-      if 'TMP' in sub.label or 'LOC' in sub.label:
+    for sub, sub_label in zip(node.subtrees, labels):
+      if 'TMP' in sub_label or 'LOC' in sub_label:
         return False
-      if sub.label in {"NP', 'NX', 'NML', 'NAC"}:
-        if len(sub.subtrees) != 1 or sub.subtrees[0].label != 'CD':
+      if sub_label in {"NP', 'NX', 'NML', 'NAC"}:
+        if len(sub.subtrees) != 1 or coindexation_free_label(sub.subtrees[0]) != 'CD':
           np_children += 1
     if np_children > 2:
       return True
@@ -187,87 +241,107 @@ def pennconverter_is_coord(node):
     terminals = False
     nonterminals = 0
     uniform = True
-    for sub in node.subtrees:
+    for sub, sub_label in zip(node.subtrees, labels):
       if sub.is_terminal():
-        if (not sub.is_punct()) and (sub.label not in {"RB', 'UH', 'IN', 'CC"}):
+        if (not sub.is_punct()) and (sub_label not in {"RB', 'UH', 'IN', 'CC"}):
           terminals = True
       else:
         nonterminals += 1
         if label is None:
-          label = sub.label
+          label = sub_label
           if label in {'SINV', 'SQ', 'SBARQ'}:
             label = 'S'
         else:
-          if sub.label in {'SINV', 'SQ', 'SBARQ'}:
+          if sub_label in {'SINV', 'SQ', 'SBARQ'}:
             if label != 'S':
               uniform = False
-          elif label != sub.label:
+          elif label != sub_label:
             uniform = False
-        if sub.word_yield(as_list=True)[-1] in {",", ";"}:
+        if last_word(sub) in {",", ";"}:
           commas = True
-    
+
     if commas and uniform and nonterminals > 1:
       return not terminals
 
   return False
 
-def pennconverter_find_heads(tree, head_map=None):
-  if head_map is None:
-    head_map = {}
-    tree = treebanks.remove_coindexation(tree, False)
-  for subtree in tree.subtrees:
-    pennconverter_find_heads(subtree, head_map)
-
-  if log: print "Head for", tree.span, tree.label
-
+def pennconverter_head(tree, label, labels, heads):
   # A word is it's own head
   if tree.word is not None:
-    head = (tree.span, tree.word, tree.label)
-    add_head(head_map, tree, head)
-    return head_map
+    return (tree.span, tree.word, label)
 
   # First handle conjunctions
-  coord = pennconverter_is_coord(tree)
+  coord = pennconverter_is_coord(tree, label, labels)
   if coord:
-    if not add_if_match(tree, {'CC', 'CONJP'}, head_map, True):
-      if not add_if_match(tree, {',', ':'}, head_map, True):
-        add_head(head_map, tree, get_head(head_map, tree.subtrees[-1]))
-    return head_map
-  
+    head = head_if_match(labels, heads, {'CC', 'CONJP'}, True)
+    if head is None:
+      head = head_if_match(labels, heads, {',', ':'}, True)
+    if head is None:
+      head = heads[-1]
+    return head
+
   # If the label for this node is not in the table we are either at the bottom,
   # at an NP, or have an error
-  base_label = treebanks.split_label_type_and_function(tree.label)[0]
+  base_label = treebanks.split_label_type_and_function(label)[0]
   if base_label not in pennconverter_mapping_table:
     if base_label in ['NP', 'NML']:
-      collins_NP(tree, head_map)
+      return collins_NP(labels, heads)
     elif base_label in ['PP', 'WHPP']:
-      pennconverter_PP(tree, head_map)
+      return pennconverter_PP(labels, heads)
     else:
-      add_head(head_map, tree, get_head(head_map, tree.subtrees[-1]))
-    return head_map
-  
+      return heads[-1]
+
   # Look through and take the first/last occurrence that matches
   info = pennconverter_mapping_table[base_label]
-  for label in info[1]:
-    for i in xrange(len(tree.subtrees)):
-      if info[0] == 'right':
-        i = len(tree.subtrees) - i - 1
-      subtree = tree.subtrees[i]
-      if isinstance(label, str):
-        if subtree.label == label:
-          add_head(head_map, tree, get_head(head_map, subtree))
-          return head_map
+  positions = range(len(labels))
+  if info[0] == 'right':
+    positions.reverse()
+  for option in info[1]:
+    for i in positions:
+      if isinstance(option, str):
+        if labels[i] == option:
+          return heads[i]
       else:
-        if re.match(label, subtree.label) is not None:
-          add_head(head_map, tree, get_head(head_map, subtree))
-          return head_map
+        if option.match(labels[i]) is not None:
+          return heads[i]
 
   # Final fallback
   if info[0] == 'left':
-    add_head(head_map, tree, get_head(head_map, tree.subtrees[0]))
+    return heads[0]
   else:
-    add_head(head_map, tree, get_head(head_map, tree.subtrees[-1]))
+    return heads[-1]
 
+def pennconverter_find_heads(tree, head_map=None):
+  '''Find the head of every node in the tree, in a single bottom-up pass that
+  does not modify or copy the tree.  Coindexation is ignored.  Returns a
+  HeadMap (or adds to the one given).
+
+  >>> tree = pstree.tree_from_text("(ROOT (S (NP-SBJ-1 (NNP Ms.) (NNP Haag)) (VP (VBZ plays) (NP (NNP Elianti))) (. .)))")
+  >>> head_map = pennconverter_find_heads(tree)
+  >>> get_head(head_map, tree)
+  ((2, 3), 'plays', 'VBZ')
+  >>> get_head(head_map, tree.subtrees[0].subtrees[0])
+  ((1, 2), 'Haag', 'NNP')
+  >>> head_map[(0, 2), 'NP-SBJ']
+  ((1, 2), 'Haag', 'NNP')
+  >>> print tree.subtrees[0].subtrees[0].label
+  NP-SBJ-1'''
+  if head_map is None:
+    head_map = HeadMap()
+  # Labels without coindexation, and heads, of nodes whose parent is not done
+  done = {}
+  for node in pstree.TreeIterator(tree, 'post'):
+    label = coindexation_free_label(node)
+    labels = []
+    heads = []
+    for subtree in node.subtrees:
+      sub_label, sub_head = done.pop(id(subtree))
+      labels.append(sub_label)
+      heads.append(sub_head)
+    if log: print "Head for", node.span, label
+    head = pennconverter_head(node, label, labels, heads)
+    add_head(head_map, node, head, label)
+    done[id(node)] = (label, head)
   return head_map
 
 '''Text from Collins' website:
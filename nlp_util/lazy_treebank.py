@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+'''Access to individual trees in a large PTB file, without parsing the rest of
+the file.  The file is memory mapped and scanned once for the position of each
+tree.  If an index directory is given, those positions are saved there for
+later runs.  Trees are only parsed when they are requested.'''
+
+import os, mmap, marshal, copy, hashlib
+from array import array
+
+import pstree, treebanks
+
+INDEX_SUFFIX = '.offsets'
+INDEX_VERSION = 2
+
+def parse_sentence_numbers(text):
+  '''Read a list of sentence numbers, such as "3,10-12".
+
+  >>> parse_sentence_numbers("3,10-12")
+  [3, 10, 11, 12]'''
+  ans = []
+  for part in text.split(','):
+    if '-' in part:
+      start, end = part.split('-')
+      ans += range(int(start), int(end) + 1)
+    else:
+      ans.append(int(part))
+  return ans
+
+class LazyTreebank:
+  '''A PTB file, giving the tree for a sentence (numbered from 0) when it is
+  requested.  Options are as for treebanks.ptb_read_tree, and as there, empty
+  trees are None.  With one_per_line set, every line is a sentence instead, as
+  when reading a file of one tree per line with readline, so blank lines and
+  empty trees such as (()) are sentences, and are None.  Slicing or calling
+  select gives a view of some of the sentences, which is also lazy.  If
+  index_dir is given, the positions of sentences are saved there.
+
+  >>> import os, tempfile
+  >>> filename = tempfile.mktemp()
+  >>> out = open(filename, 'w')
+  >>> print >> out, "(ROOT (NP (NNP Newspaper)))\\n(ROOT\\n  (NP (NN paper)))\\n\\n(ROOT (S (NP (PRP It)) (VP (VBZ is))))"
+  >>> out.close()
+  >>> index_dir = tempfile.mkdtemp()
+  >>> treebank = LazyTreebank(filename, blank_line_coverage=True, index_dir=index_dir)
+  >>> len(treebank)
+  4
+  >>> treebank[3]
+  (ROOT (S (NP (PRP It)) (VP (VBZ is))))
+  >>> print treebank[2]
+  None
+  >>> treebank.get_text(1)
+  '(ROOT   (NP (NN paper)))'
+  >>> for tree in treebank[:2]:
+  ...   print tree
+  (ROOT (NP (NNP Newspaper)))
+  (ROOT (NP (NN paper)))
+  >>> view = treebank.select([3, 0])
+  >>> view.ids
+  [3, 0]
+  >>> view[0]
+  (ROOT (S (NP (PRP It)) (VP (VBZ is))))
+  >>> len(os.listdir(index_dir))
+  1
+  >>> len(LazyTreebank(filename, blank_line_coverage=True, index_dir=index_dir))
+  4
+  >>> lines = LazyTreebank(filename, one_per_line=True)
+  >>> len(lines)
+  5
+  >>> lines.get_text(1), lines.get_text(3)
+  ('(ROOT', None)
+  >>> os.remove(filename)
+  >>> os.remove(os.path.join(index_dir, os.listdir(index_dir)[0]))
+  >>> os.rmdir(index_dir)'''
+  def __init__(self, filename, return_empty=False, allow_empty_labels=False, allow_empty_words=False, blank_line_coverage=False, one_per_line=False, index_dir=None, ids=None):
+    self.filename = filename
+    self.allow_empty_labels = allow_empty_labels
+    self.allow_empty_words = allow_empty_words
+    if os.path.getsize(filename) == 0:
+      # Empty files cannot be memory mapped
+      self.data = ''
+    else:
+      source = open(filename, 'rb')
+      self.data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+      source.close()
+    self.starts, self.ends = read_index(filename, self.data, return_empty, blank_line_coverage, one_per_line, index_dir)
+    # The sentences in this view of the file
+    self.ids = ids
+    if ids is None:
+      self.ids = range(len(self.starts))
+
+  def view(self, ids):
+    ans = copy.copy(self)
+    ans.ids = ids
+    return ans
+
+  def select(self, ids):
+    '''A view of the given sentences, in the given order.  Ids are positions in
+    this treebank.'''
+    return self.view([self.ids[sent_id] for sent_id in ids])
+
+  def __len__(self):
+    return len(self.ids)
+
+  def get_text(self, index):
+    '''The text of a tree (with newlines and tabs as spaces, and surrounding
+    space removed), or None for an empty tree or blank line.  With one_per_line
+    this is the text of the line, which may be an empty tree, e.g. (()).'''
+    sent_id = self.ids[index]
+    start = self.starts[sent_id]
+    end = self.ends[sent_id]
+    if start == end:
+      return None
+    text = self.data[start:end].replace('\n', ' ').replace('\t', ' ').strip()
+    if text == '':
+      return None
+    return text
+
+  def __getitem__(self, index):
+    if type(index) == slice:
+      return self.view(self.ids[index])
+    text = self.get_text(index)
+    if text is None or '()' in text:
+      return None
+    tree = pstree.tree_from_text(text, self.allow_empty_labels, self.allow_empty_words)
+    treebanks.ptb_cleaning(tree)
+    return tree
+
+  def __iter__(self):
+    for index in xrange(len(self)):
+      yield self[index]
+
+def index_path(filename, index_dir):
+  '''The file in index_dir for the positions of sentences in filename.'''
+  name = hashlib.sha1(os.path.abspath(filename)).hexdigest()
+  return os.path.join(index_dir, name + INDEX_SUFFIX)
+
+def read_index(filename, data, return_empty, blank_line_coverage, one_per_line=False, index_dir=None):
+  '''Get the start and end of each sentence in the file, from index_dir if
+  it has an up to date index, otherwise by scanning the data (and then saving
+  the index in index_dir, if given and possible).  Empty trees have the same
+  start and end.'''
+  stat = os.stat(filename)
+  header = (INDEX_VERSION, stat.st_size, stat.st_mtime, return_empty, blank_line_coverage, one_per_line, array('L').itemsize)
+  path = None
+  if index_dir is not None:
+    path = index_path(filename, index_dir)
+  if path is not None and os.path.exists(path):
+    saved = marshal.load(open(path, 'rb'))
+    if saved[0] == header:
+      starts = array('L')
+      starts.fromstring(saved[1])
+      ends = array('L')
+      ends.fromstring(saved[2])
+      return starts, ends
+
+  starts = array('L')
+  ends = array('L')
+  if one_per_line:
+    pos = 0
+    while pos < len(data):
+      end = data.find('\n', pos)
+      if end < 0:
+        end = len(data)
+      starts.append(pos)
+      ends.append(end)
+      pos = end + 1
+  elif len(data) > 0:
+    data.seek(0)
+    for text, start, end in treebanks.ptb_generate_tree_text(data, return_empty, blank_line_coverage, offsets=True):
+      starts.append(start)
+      if text == "Empty":
+        end = start
+      ends.append(end)
+  if path is None:
+    return starts, ends
+  try:
+    if not os.path.exists(index_dir):
+      os.makedirs(index_dir)
+    out = open(path, 'wb')
+    marshal.dump((header, starts.tostring(), ends.tostring()), out)
+    out.close()
+  except (IOError, OSError):
+    # The index is only an optimisation, so it does not matter if it is not saved
+    pass
+  return starts, ends
+
+if __name__ == '__main__':
+  print "Running doctest"
+  import doctest
+  doctest.testmod()
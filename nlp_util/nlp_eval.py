@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+from collections import defaultdict
+
 def coreference_cluster_match(gold, auto):
 	if len(gold) != len(auto):
 		return False
@@ -44,6 +46,116 @@ def calc_prf(match, gold, test):
 	except:
 		return 0.0, 0.0, 0.0
 
+def percent(count, total):
+	if total == 0:
+		return 0.0
+	return 100.0 * count / total
+
+class EvalbSummary:
+	'''Running totals for the summary evalb prints, updated one sentence at a
+	time, so that memory use does not grow with the number of sentences.
+	Sentences of at most each of the cutoff lengths are also summarised
+	separately.
+
+	>>> summary = EvalbSummary(cutoffs=[3])
+	>>> summary.add(3, 2, 2, 2, 0, 3)
+	>>> summary.add(5, 3, 4, 5, 1, 4)
+	>>> summary.add(4, 0, 3, 0, 0, 0)
+	>>> summary.add_unscored(2)
+	>>> ans = summary.summary()
+	>>> ans['sentences'], ans['parsed'], ans['skipped'], ans['match'], ans['crossing']
+	(4, 2, 1, 5, 1)
+	>>> print "{f:.2f} {all_brackets_match:.2f} {perfect:.2f} {max2_crossing:.2f}".format(**ans)
+	62.50 25.00 25.00 75.00
+	>>> ans = summary.cutoffs[0][1].summary()
+	>>> ans['sentences'], ans['words'], ans['f']
+	(2, 3, 100.0)
+	>>> summary = EvalbSummary(False)
+	>>> summary.add(3, 2, 2, 2, 0, 3)
+	>>> summary.add(4, 0, 3, 0, 0, 0)
+	>>> ans = summary.summary()
+	>>> ans['parsed'], ans['skipped'], ans['gcount'], ans['perfect']
+	(1, 0, 2, 100.0)'''
+	def __init__(self, include_unparsed=True, cutoffs=()):
+		self.include_unparsed = include_unparsed
+		self.sentences = 0
+		self.parsed = 0
+		self.skipped = 0
+		self.words = 0
+		self.match = 0
+		self.gcount = 0
+		self.tcount = 0
+		self.crossing = 0
+		self.POS = 0
+		self.complete = 0
+		self.perfect = 0
+		# Number of crossing brackets -> number of sentences with that many
+		self.crossing_histogram = defaultdict(int)
+		self.cutoffs = [(cutoff, EvalbSummary(include_unparsed)) for cutoff in sorted(cutoffs)]
+
+	def add(self, length, match, gcount, tcount, crossing, POS):
+		'''Add the counts for a sentence, where a test count of zero indicates the
+		sentence was not parsed.'''
+		self.sentences += 1
+		for cutoff, summary in self.cutoffs:
+			if length <= cutoff:
+				summary.add(length, match, gcount, tcount, crossing, POS)
+		if tcount != 0:
+			self.parsed += 1
+		elif self.include_unparsed:
+			self.skipped += 1
+		else:
+			return
+		self.words += length
+		self.match += match
+		self.gcount += gcount
+		self.tcount += tcount
+		self.crossing += crossing
+		self.POS += POS
+		if match == gcount == tcount:
+			self.complete += 1
+			if POS == length:
+				self.perfect += 1
+		self.crossing_histogram[crossing] += 1
+
+	def add_unscored(self, length=None):
+		'''Count a sentence that could not be scored, which only affects the
+		averages over sentences.'''
+		self.sentences += 1
+		if length is not None:
+			for cutoff, summary in self.cutoffs:
+				if length <= cutoff:
+					summary.add_unscored(length)
+
+	def summary(self):
+		'''Overall scores, as a dictionary.'''
+		ans = {}
+		sents = self.sentences
+		if not self.include_unparsed:
+			sents = self.parsed
+		ans['sentences'] = self.sentences
+		ans['parsed'] = self.parsed
+		ans['skipped'] = self.skipped
+		ans['words'] = self.words
+		ans['match'] = self.match
+		ans['gcount'] = self.gcount
+		ans['tcount'] = self.tcount
+		ans['crossing'] = self.crossing
+		ans['POS'] = self.POS
+		p, r, f = calc_prf(self.match, self.gcount, self.tcount)
+		ans['f'] = f * 100
+		ans['r'] = r * 100
+		ans['p'] = p * 100
+		ans['POS_acc'] = percent(self.POS, self.words)
+		ans['all_brackets_match'] = percent(self.complete, sents)
+		ans['perfect'] = percent(self.perfect, sents)
+		ans['av_crossing'] = 0.0
+		if sents > 0:
+			ans['av_crossing'] = float(self.crossing) / sents
+		ans['no_crossing'] = percent(self.crossing_histogram[0], sents)
+		ans['max2_crossing'] = percent(sum([self.crossing_histogram[i] for i in xrange(3)]), sents)
+		return ans
+
 if __name__ == "__main__":
 	print "Running doctest"
 	import doctest
@@ -2,10 +2,10 @@
 
 from collections import defaultdict
 
-import pstree
+import pstree, frozen_tree
 
 class Parse_Error_Set:
-	def __init__(self, gold=None, test=None, include_terminals=False):
+	def __init__(self, gold=None, test=None, include_terminals=False, gold_brackets=None):
 		self.missing = []
 		self.crossing = []
 		self.extra = []
@@ -13,7 +13,7 @@ class Parse_Error_Set:
 		self.spans = {}
 
 		if gold is not None and test is not None:
-			errors = get_errors(test, gold, include_terminals)
+			errors = get_errors(test, gold, include_terminals, gold_brackets)
 			for error in errors:
 				if len(error) > 4:
 					self.add_error(error[0], error[1], error[2], error[3], error[4])
@@ -49,82 +49,193 @@ class Parse_Error_Set:
 	def __len__(self):
 		return len(self.missing) + len(self.extra) + len(self.crossing) + (2*len(self.POS))
 
-def get_errors(test, gold, include_terminals=False):
-	ans = []
+def tree_nodes(tree):
+	'''Yield (span, label, is terminal, is root, node) for each node of a
+	PSTree or a FrozenTree, in pre-order.  For a FrozenTree the node is its id.
+
+	>>> tree = pstree.tree_from_text("(ROOT (NP (NNP Newspaper)))")
+	>>> list(tree_nodes(frozen_tree.freeze(tree)))
+	[((0, 1), 'ROOT', False, True, 0), ((0, 1), 'NP', False, False, 1), ((0, 1), 'NNP', True, False, 2)]
+	>>> [info[:4] for info in tree_nodes(tree)] == [info[:4] for info in tree_nodes(frozen_tree.freeze(tree))]
+	True'''
+	if isinstance(tree, frozen_tree.FrozenTree):
+		labels = frozen_tree.labels
+		offsets = tree.child_offsets
+		for node in xrange(len(tree)):
+			yield ((tree.starts[node], tree.ends[node]), labels[tree.label_ids[node]],
+				offsets[node] == offsets[node + 1], tree.parents[node] < 0, node)
+	else:
+		for node in tree:
+			yield (node.span, node.label, node.is_terminal(), node.parent is None, node)
 
-	gold_spans = []
-	gold_POS = {}
-	gold_span_set = defaultdict(lambda: 0)
-	for span in gold:
-		if span.is_terminal():
+def get_brackets(tree, include_terminals=False):
+	'''Get the brackets of a tree (a PSTree or a FrozenTree), as used by
+	get_errors.  Returns a list of ((start, end, label), node) for
+	nonterminals, a count for each of those keys, a map from span to label for
+	terminals (if include_terminals is set), and the number of nonterminals
+	that are the root.  When scoring several trees against the same gold tree
+	this can be computed once and passed to get_errors or counts_for_prf.'''
+	spans = []
+	POS = {}
+	roots = 0
+	span_counts = defaultdict(lambda: 0)
+	for span, label, terminal, root, node in tree_nodes(tree):
+		if terminal:
 			if include_terminals:
-				gold_POS[span.span] = span.label
+				POS[span] = label
 			continue
-		key = (span.span[0], span.span[1], span.label)
-		gold_span_set[key] += 1
-		gold_spans.append((key, span))
+		key = (span[0], span[1], label)
+		span_counts[key] += 1
+		spans.append((key, node))
+		if root:
+			roots += 1
+	return spans, dict(span_counts), POS, roots
+
+def sparse_table(values, better):
+	# tables[k][i] is the best of values[i:i + 2**k]
+	tables = [values]
+	width = 1
+	while width * 2 <= len(values):
+		prev = tables[-1]
+		tables.append([better(prev[i], prev[i + width]) for i in xrange(len(values) - width * 2 + 1)])
+		width *= 2
+	return tables
+
+def get_crossing_index(spans, length):
+	'''For each position, find the lowest start of the brackets that end there,
+	and the highest end of the brackets that start there.  A bracket (a, b)
+	crosses one of the given brackets if one ending inside it starts before a,
+	or one starting inside it ends after b.  Both are kept in sparse tables, so
+	the minimum or maximum for any range of positions is found in constant time.
+
+	>>> spans = [((0, 4, 'S'), None), ((2, 6, 'VP'), None)]
+	>>> index = get_crossing_index(spans, 6)
+	>>> index[0][0], index[1][0]
+	([7, 7, 7, 7, 0, 7, 2], [4, -1, 6, -1, -1, -1, -1])
+	>>> crosses(index, 1, 3)
+	True
+	>>> crosses(index, 0, 6)
+	False'''
+	lowest_start = [length + 1] * (length + 1)
+	highest_end = [-1] * (length + 1)
+	for key, span in spans:
+		start, end = key[0], key[1]
+		if start < lowest_start[end]:
+			lowest_start[end] = start
+		if end > highest_end[start]:
+			highest_end[start] = end
+	return sparse_table(lowest_start, min), sparse_table(highest_end, max)
+
+def crosses(crossing_index, start, end):
+	'''Check if the bracket (start, end) crosses any of the brackets in the
+	index from get_crossing_index.'''
+	if end - start < 2:
+		return False
+	lowest_start, highest_end = crossing_index
+	# Positions start + 1 to end - 1, covered by two overlapping ranges of
+	# width 2**level
+	level = (end - start - 1).bit_length() - 1
+	other = end - (1 << level)
+	if min(lowest_start[level][start + 1], lowest_start[level][other]) < start:
+		return True
+	return max(highest_end[level][start + 1], highest_end[level][other]) > end
+
+def get_errors(test, gold, include_terminals=False, gold_brackets=None):
+	'''Find the brackets that differ between the trees, which may be PSTrees or
+	FrozenTrees.  Each error is (type, span, label, node), with the gold label
+	added for POS errors, where the node is in the tree the error is for (an id
+	for a FrozenTree).
+
+	>>> gold = pstree.tree_from_text("(ROOT (S (NP (NNP Ms.) (NNP Haag)) (VP (VBZ plays) (NP (NNP Elianti)))))")
+	>>> test = pstree.tree_from_text("(ROOT (S (NP (NNP Ms.)) (VP (VBZ Haag) (VBZ plays) (NP (NNP Elianti)))))")
+	>>> for error in get_errors(test, frozen_tree.freeze(gold), True):
+	...   print error[:3]
+	('diff POS', (1, 2), 'VBZ')
+	('extra', (0, 1), 'NP')
+	('extra', (1, 4), 'VP')
+	('crossing', (0, 2), 'NP')
+	('missing', (2, 4), 'VP')
+	>>> get_errors(frozen_tree.freeze(test), gold, True)[1]
+	('extra', (0, 1), 'NP', 2)'''
+	ans = []
+
+	if gold_brackets is None:
+		gold_brackets = get_brackets(gold, include_terminals)
+	gold_spans, gold_span_set, gold_POS = gold_brackets[:3]
+	# The counts are used up as brackets are matched
+	gold_span_set = gold_span_set.copy()
 
 	test_spans = []
 	test_span_set = defaultdict(lambda: 0)
-	for span in test:
-		if span.is_terminal():
+	for span, label, terminal, root, node in tree_nodes(test):
+		if terminal:
 			if include_terminals:
-				tnode = span
-				gold_label = gold_POS[tnode.span]
-				if gold_label != tnode.label:
-					ans.append(('diff POS', tnode.span, tnode.label, tnode, gold_label))
+				gold_label = gold_POS[span]
+				if gold_label != label:
+					ans.append(('diff POS', span, label, node, gold_label))
 			continue
-		key = (span.span[0], span.span[1], span.label)
+		key = (span[0], span[1], label)
 		test_span_set[key] += 1
-		test_spans.append((key, span))
+		test_spans.append((key, node))
 
 	# Extra
-	for key, span in test_spans:
+	for key, node in test_spans:
 		count = gold_span_set.get(key)
 		if count is None or count == 0:
-			ans.append(('extra', span.span, span.label, span))
+			ans.append(('extra', key[:2], key[2], node))
 		else:
 			gold_span_set[key] -= 1
 
-	# Missing and crossing
-	for key, span in gold_spans:
+	# Missing and crossing, with an index of test brackets by position to find
+	# crossing brackets (only built if something is missing)
+	crossing_index = None
+	for key, node in gold_spans:
 		count = test_span_set.get(key)
 		if count is None or count == 0:
+			if crossing_index is None:
+				length = max([tkey[1] for tkey, tnode in test_spans] + [gkey[1] for gkey, gnode in gold_spans])
+				crossing_index = get_crossing_index(test_spans, length)
 			name = 'missing'
-			for tkey, tspan in test_spans:
-				if tkey[0] < key[0] < tkey[1] < key[1]:
-					name = 'crossing'
-					break
-				elif key[0] < tkey[0] < key[1] < tkey[1]:
-					name = 'crossing'
-					break
-			ans.append((name, span.span, span.label, span))
+			if crosses(crossing_index, key[0], key[1]):
+				name = 'crossing'
+			ans.append((name, key[:2], key[2], node))
 		else:
 			test_span_set[key] -= 1
 	return ans
 
-def counts_for_prf(test, gold, include_root=False, include_terminals=False):
+def count_brackets(brackets, include_root=False, include_terminals=False):
+	'''The number of brackets counted for a tree by counts_for_prf, given
+	get_brackets(tree, True).'''
+	count = len(brackets[0])
+	if not include_root:
+		count -= brackets[3]
+	if include_terminals:
+		count += len(brackets[2])
+	return count
+
+def counts_for_prf(test, gold, include_root=False, include_terminals=False, gold_brackets=None):
+	'''Count matching, gold and test brackets, crossing brackets and POS
+	errors.  The trees may be PSTrees or FrozenTrees, and gold_brackets, if
+	given, must be get_brackets(gold, True).'''
 	# Note - currently assumes the roots match
 	tcount = 0
-	for node in test:
-		if node.is_terminal() and not include_terminals:
+	for span, label, terminal, root, node in tree_nodes(test):
+		if terminal and not include_terminals:
 			continue
-		if node.parent is None and not include_root:
+		if root and not include_root:
 			continue
 		tcount += 1
-	gcount = 0
-	for node in gold:
-		if node.is_terminal() and not include_terminals:
-			continue
-		if node.parent is None and not include_root:
-			continue
-		gcount += 1
+	if gold_brackets is None:
+		gold_brackets = get_brackets(gold, True)
+	gcount = count_brackets(gold_brackets, include_root, include_terminals)
 	match = tcount
-	errors = Parse_Error_Set(gold, test, True)
+	errors = Parse_Error_Set(gold, test, True, gold_brackets)
 	match = tcount - len(errors.extra)
 	if include_terminals:
 		match -= len(errors.POS)
 	return match, gcount, tcount, len(errors.crossing), len(errors.POS)
 
 if __name__ == '__main__':
-	print "No unit testing implemented for Error_Set"
+	print "Running doctest"
+	import doctest
+	doctest.testmod()
@@ -7,6 +7,13 @@ from collections import defaultdict
 DEFAULT_LABEL = 'label_not_set'
 TRACE_LABEL = '-NONE-'
 
+# Labels are repeated constantly across a treebank, so a single copy of each
+# is kept and shared by all nodes.
+label_table = {}
+def intern_label(label):
+  '''Return the shared copy of the given label.'''
+  return label_table.setdefault(label, label)
+
 class TreeIterator:
   '''Iterator for traversal of a tree.
   
@@ -24,40 +31,51 @@ class TreeIterator:
   (. .)
   (S (NP-SBJ (NNP Ms.) (NNP Haag)) (VP (VBZ plays) (NP (NNP Elianti))) (. .))
   (ROOT (S (NP-SBJ (NNP Ms.) (NNP Haag)) (VP (VBZ plays) (NP (NNP Elianti))) (. .)))
+
+  The traversal keeps its own stack rather than following parent links, so
+  depth is not limited and parents do not need to be set.
   '''
   def __init__(self, tree, order='pre'):
-    self.tree = tree
-    self.pos = [0]
     self.order = order
+    if order == 'pre':
+      # Nodes still to visit, and the last node returned, which has its
+      # subtrees added when the traversal continues
+      self.stack = [tree]
+      self.last = None
+      self.next = self.next_pre
+    else:
+      # Nodes on the path from the root, with the next subtree to visit
+      self.stack = [tree]
+      self.pos = [0]
 
   def __iter__(self):
     return self
 
+  def next_pre(self):
+    if self.last is not None:
+      self.stack.extend(reversed(self.last.subtrees))
+    if len(self.stack) == 0:
+      self.last = None
+      raise StopIteration
+    self.last = self.stack.pop()
+    return self.last
+
   def next(self):
-    while True:
-      if len(self.pos) == 0:
-        raise StopIteration
-
-      # For pre-order traversal, return nodes when first reached
-      ans = None
-      if self.order == 'pre' and self.pos[-1] == 0:
-        ans = self.tree
-
-      # Update internal state to point at the next node in the tree
-      if self.pos[-1] < len(self.tree.subtrees):
-        self.tree = self.tree.subtrees[self.pos[-1]]
-        self.pos[-1] += 1
-        self.pos.append(0)
+    stack = self.stack
+    pos = self.pos
+    while len(stack) > 0:
+      tree = stack[-1]
+      if pos[-1] < len(tree.subtrees):
+        stack.append(tree.subtrees[pos[-1]])
+        pos[-1] += 1
+        pos.append(0)
       else:
-        if self.order == 'post':
-          ans = self.tree
-        self.tree = self.tree.parent
-        self.pos.pop()
+        stack.pop()
+        pos.pop()
+        return tree
+    raise StopIteration
 
-      if ans is not None:
-        return ans
-
-class PSTree:
+class PSTree(object):
   '''Phrase Structure Tree
 
   >>> tree = tree_from_text("(ROOT (NP (NNP Newspaper)))")
@@ -78,7 +96,34 @@ class PSTree:
   (VP (VBD was) (VP (VBN named) (S (NP-SBJ (-NONE- *-1)) (NP-PRD (NP (DT a) (JJ nonexecutive) (NN director)) (PP (IN of) (NP (DT this) (JJ British) (JJ industrial) (NN conglomerate)))))))
   >>> tree.word_yield()
   'was named *-1 a nonexecutive director of this British industrial conglomerate'
+
+  Nodes use slots rather than an attribute dictionary to keep large treebanks
+  small in memory, and labels read from text are shared between nodes:
+  >>> tree.label is tree.subtrees[1].label
+  True
+
+  Trees can be pickled with any protocol:
+  >>> import cPickle
+  >>> copy = cPickle.loads(cPickle.dumps(tree))
+  >>> print copy
+  (VP (VBD was) (VP (VBN named) (S (NP-SBJ (-NONE- *-1)) (NP-PRD (NP (DT a) (JJ nonexecutive) (NN director)) (PP (IN of) (NP (DT this) (JJ British) (JJ industrial) (NN conglomerate)))))))
+  >>> copy.subtrees[1].parent is copy, copy.wordspan == tree.wordspan
+  (True, True)
+  >>> copy.label is tree.label
+  True
   '''
+  __slots__ = ['word', 'label', 'span', 'wordspan', 'parent', 'subtrees']
+
+  def __getstate__(self):
+    # Classes with slots and no __getstate__ can only be pickled with
+    # protocol 2
+    return tuple(getattr(self, name) for name in PSTree.__slots__)
+
+  def __setstate__(self, state):
+    for name, value in zip(PSTree.__slots__, state):
+      setattr(self, name, value)
+    self.label = intern_label(self.label)
+
   def __init__(self, word=None, label=DEFAULT_LABEL, span=(0, 0), parent=None, subtrees=None):
     self.word = word
     self.label = label
@@ -96,10 +141,13 @@ class PSTree:
   
   def clone(self):
     ans = PSTree(self.word, self.label, self.span)
-    for subtree in self.subtrees:
-      subclone = subtree.clone()
-      subclone.parent = ans
-      ans.subtrees.append(subclone)
+    stack = [(self, ans)]
+    while len(stack) > 0:
+      tree, copy = stack.pop()
+      for subtree in tree.subtrees:
+        subclone = PSTree(subtree.word, subtree.label, subtree.span, copy)
+        copy.subtrees.append(subclone)
+        stack.append((subtree, subclone))
     return ans
 
   def is_terminal(self):
@@ -119,38 +167,53 @@ class PSTree:
 
   def root(self):
     '''Follow parents until a node is reached that has no parent.'''
-    if self.parent is not None:
-      return self.parent.root()
-    else:
-      return self
+    ans = self
+    while ans.parent is not None:
+      ans = ans.parent
+    return ans
 
   def __repr__(self):
     '''Return a bracket notation style representation of the tree.'''
     # TODO: Shift this to str and add more field info
-    ans = '('
-    if self.is_trace():
-      ans += TRACE_LABEL + ' ' + self.word
-    elif self.is_terminal():
-      ans += self.label + ' ' + self.word
-    else:
-      ans += self.label
-    for subtree in self.subtrees:
-      ans += ' ' + subtree.__repr__()
-    ans += ')'
-    return ans
+    ans = []
+    # None marks where a bracket is closed
+    stack = [self]
+    while stack:
+      tree = stack.pop()
+      if tree is None:
+        ans.append(')')
+      elif tree.subtrees:
+        ans.append(' (' + tree.label)
+        stack.append(None)
+        stack.extend(reversed(tree.subtrees))
+      else:
+        ans.append(' (' + tree.label + ' ' + tree.word)
+        ans.append(')')
+    return ''.join(ans)[1:]
 
   def calculate_spans(self, left=0, wordleft=0):
     '''Update the spans for every node in this tree.'''
     right = left
     wordright = wordleft
-    if self.is_terminal():
-      if not self.is_trace():
-        wordright += 1
-      right += 1
-    for subtree in self.subtrees:
-      right, wordright = subtree.calculate_spans(right, wordright)
-    self.span = (left, right)
-    self.wordspan = (wordleft, wordright)
+    # Nodes are visited twice, first to note where they start, then to set
+    # their spans once all of their subtrees are done
+    stack = [(self, None, None)]
+    while stack:
+      tree, left, wordleft = stack.pop()
+      if left is not None:
+        tree.span = (left, right)
+        tree.wordspan = (wordleft, wordright)
+      elif tree.subtrees:
+        stack.append((tree, right, wordright))
+        stack.extend([(subtree, None, None) for subtree in reversed(tree.subtrees)])
+      else:
+        if tree.label == TRACE_LABEL:
+          tree.wordspan = (wordright, wordright)
+        else:
+          tree.wordspan = (wordright, wordright + 1)
+          wordright += 1
+        tree.span = (right, right + 1)
+        right += 1
     return right, wordright
 
   def check_consistency(self):
@@ -184,11 +247,13 @@ class PSTree:
     (node label, node span, ((subtree1, end1), (subtree2, end2)...))'''
     if ans is None:
       ans = []
-    if len(self.subtrees) > 0:
-      cur = (self.label, self.span, tuple([(sub.label, sub.span[1]) for sub in self.subtrees]))
-      ans.append(cur)
-      for sub in self.subtrees:
-        sub.production_list(ans)
+    stack = [self]
+    while stack:
+      tree = stack.pop()
+      if tree.subtrees:
+        cur = (tree.label, tree.span, tuple([(sub.label, sub.span[1]) for sub in tree.subtrees]))
+        ans.append(cur)
+        stack.extend(reversed(tree.subtrees))
     return ans
 
   def word_yield(self, span=None, as_list=False):
@@ -206,13 +271,14 @@ class PSTree:
         return None
     else:
       ans = []
-      for subtree in self.subtrees:
-        words = subtree.word_yield(span, as_list)
-        if words is not None:
-          if as_list:
-            ans += words
-          else:
-            ans.append(words)
+      stack = [self]
+      while stack:
+        tree = stack.pop()
+        if tree.subtrees:
+          stack.extend(reversed(tree.subtrees))
+        elif tree.word is not None:
+          if span is None or span[0] <= tree.span[0] < span[1]:
+            ans.append(tree.word)
       if not as_list:
         ans = ' '.join(ans)
       return ans
@@ -222,9 +288,15 @@ class PSTree:
     take into consideration unaries like (NP (NP ...))'''
     if node_dict is None:
       node_dict = defaultdict(lambda: [])
-    for subtree in self.subtrees:
-      subtree.node_dict(depth + 1, node_dict)
-    node_dict[(self.label, self.span[0], self.span[1])].append(depth)
+    # Nodes are added after their subtrees, as in a post-order traversal
+    stack = [(self, depth, False)]
+    while stack:
+      tree, depth, done = stack.pop()
+      if done or not tree.subtrees:
+        node_dict[(tree.label, tree.span[0], tree.span[1])].append(depth)
+      else:
+        stack.append((tree, depth, True))
+        stack.extend([(subtree, depth + 1, False) for subtree in reversed(tree.subtrees)])
     return node_dict
 
   def get_nodes(self, request='all', start=-1, end=-1, node_list=None):
@@ -288,61 +360,161 @@ class PSTree:
     else:
       return start
 
+token_re = re.compile(r'(\()([^()]*)(\)?)([^()]*)|\)([^()]*)')
 def tree_from_text(text, allow_empty_labels=False, allow_empty_words=False):
   '''Construct a PSTree from the provided string, which is assumed to represent
   a tree with nested round brackets.  Nodes are labeled by the text between the
   open bracket and the next space (possibly an empty string).  Words are the
-  text after that space and before the close bracket.'''
+  text after that space and before the close bracket.
+
+  The text is tokenised by a single regular expression into open and close
+  brackets, each with the atom of text that follows it.  Leaves, e.g. (NN
+  dog), are matched as one token.  Spans are set as each node is closed.
+
+  >>> tree_from_text("(ROOT (NP (NNP Newspaper) (-NONE- *T*-1) (NN tree)))").subtrees[0].subtrees[2].wordspan
+  (1, 2)
+  >>> tree_from_text("(ROOT (NP (NNP Newspaper))")
+  Traceback (most recent call last):
+  ...
+  Exception: Text did not include complete tree
+  (ROOT (NP (NNP Newspaper))'''
   root = None
   cur = None
+  stack = []
   pos = 0
-  word = ''
-  for char in text:
-    # Consume random text up to the first '('
+  wordpos = 0
+  atom = ''
+  for is_open, open_atom, is_leaf, leaf_atom, close_atom in token_re.findall(text):
     if cur is None:
-      if char == '(':
+      # Consume random text up to the first '('
+      if not is_open:
+        continue
+    else:
+      # The label runs up to the first space, the rest is the word
+      word = atom
+      if cur.label is DEFAULT_LABEL and ' ' in word:
+        label, word = word.split(' ', 1)
+        if len(label) == 0 and not allow_empty_labels:
+          raise Exception("Empty label found\n%s" % text)
+        cur.label = intern_label(label)
+      word = word.strip()
+
+    if is_open:
+      if cur is None:
         root = PSTree()
         cur = root
-      continue
+        stack = [(0, 0)]
+        pos = 0
+        wordpos = 0
+      else:
+        if cur.label is DEFAULT_LABEL:
+          if len(word) == 0 and not allow_empty_labels:
+            raise Exception("Empty label found\n%s" % text)
+          cur.label = intern_label(word)
+          word = ''
+        if word != '':
+          raise Exception("Stray '%s' while processing\n%s" % (word, text))
+        sub = PSTree(None, DEFAULT_LABEL, (0, 0), cur)
+        cur.subtrees.append(sub)
+        cur = sub
+        stack.append((pos, wordpos))
+      atom = open_atom
+      if not is_leaf:
+        continue
 
-    if char == '(':
-      word = word.strip()
-      if cur.label is DEFAULT_LABEL:
-        if len(word) == 0 and not allow_empty_labels:
+      # A leaf is closed straight away
+      word = atom
+      if ' ' in word:
+        label, word = word.split(' ', 1)
+        if len(label) == 0 and not allow_empty_labels:
           raise Exception("Empty label found\n%s" % text)
-        cur.label = word
-        word = ''
-      if word != '':
-        raise Exception("Stray '%s' while processing\n%s" % (word, text))
-      sub = PSTree()
-      cur.subtrees.append(sub)
-      sub.parent = cur
-      cur = sub
-    elif char == ')':
+        cur.label = intern_label(label)
       word = word.strip()
-      if word != '':
-        if len(word) == 0 and not allow_empty_words:
-          raise Exception("Empty word found\n%s" % text)
-        cur.word = word
-        word = ''
-        cur.span = (pos, pos + 1)
-        pos += 1
-      else:
-        cur.span = (cur.subtrees[0].span[0], cur.subtrees[-1].span[1])
-      cur = cur.parent
-    elif char == ' ':
-      if cur.label is DEFAULT_LABEL:
-        if len(word) == 0 and not allow_empty_labels:
-          raise Exception("Empty label found\n%s" % text)
-        cur.label = word
-        word = ''
-      else:
-        word += char
-    else:
-      word += char
-  if cur is not None:
+      close_atom = leaf_atom
+
+    if word != '':
+      cur.word = word
+    elif len(cur.subtrees) == 0:
+      raise Exception("Empty word found\n%s" % text)
+    left, wordleft = stack.pop()
+    if len(cur.subtrees) == 0:
+      pos += 1
+      if cur.label != TRACE_LABEL:
+        wordpos += 1
+    cur.span = (left, pos)
+    cur.wordspan = (wordleft, wordpos)
+    cur = cur.parent
+    atom = close_atom
+  if cur is not None and cur.label is DEFAULT_LABEL and atom.startswith(' '):
+    if not allow_empty_labels:
+      raise Exception("Empty label found\n%s" % text)
+  if cur is not None or root is None:
     raise Exception("Text did not include complete tree\n%s" % text)
-  root.calculate_spans()
+  return root
+
+def tree_from_conll(words, tags, parse_bits):
+  '''Construct a PSTree from the columns of a CoNLL / OntoNotes sentence: the
+  words, POS tags, and parse bits (e.g. "(TOP(S(NP*)").  Nodes are created
+  directly, giving the same tree as tree_from_text would for the bracketed
+  text the columns represent.
+
+  >>> tree = tree_from_conll(['They', 'left', '.'], ['PRP', 'VBD', '.'], ['(TOP(S(NP*)', '(VP*)', '*))'])
+  >>> print tree
+  (TOP (S (NP (PRP They)) (VP (VBD left)) (. .)))
+  >>> tree.subtrees[0].span
+  (0, 3)
+  >>> tree_from_conll(['They', 'left'], ['PRP', 'VBD'], ['(TOP(S(NP*)', '(VP*)'])
+  Traceback (most recent call last):
+  ...
+  Exception: Columns did not include complete tree
+  (TOP(S(NP*) (VP*)'''
+  root = None
+  cur = None
+  stack = []
+  pos = 0
+  wordpos = 0
+  for word, tag, bit in zip(words, tags, parse_bits):
+    star = bit.find('*')
+    if star < 0:
+      raise Exception("Parse bit without a word: %s" % bit)
+    opening = bit[:star]
+    if opening != '':
+      labels = opening.split('(')
+      if labels[0] != '':
+        raise Exception("Stray '%s' in parse bit %s" % (labels[0], bit))
+      for label in labels[1:]:
+        if len(label) == 0:
+          raise Exception("Empty label found in parse bit %s" % bit)
+        node = PSTree(None, intern_label(label), (0, 0), cur)
+        if cur is None:
+          if root is not None:
+            raise Exception("Columns include more than one tree")
+          root = node
+        else:
+          cur.subtrees.append(node)
+        cur = node
+        stack.append((pos, wordpos))
+    if cur is None:
+      raise Exception("Word outside of the tree: %s" % word)
+
+    leaf = PSTree(word, intern_label(tag), (pos, pos + 1), cur)
+    cur.subtrees.append(leaf)
+    pos += 1
+    if leaf.label != TRACE_LABEL:
+      leaf.wordspan = (wordpos, wordpos + 1)
+      wordpos += 1
+    else:
+      leaf.wordspan = (wordpos, wordpos)
+
+    for char in bit[star + 1:]:
+      if char != ')' or cur is None:
+        raise Exception("Stray '%s' in parse bit %s" % (char, bit))
+      left, wordleft = stack.pop()
+      cur.span = (left, pos)
+      cur.wordspan = (wordleft, wordpos)
+      cur = cur.parent
+  if cur is not None or root is None:
+    raise Exception("Columns did not include complete tree\n%s" % ' '.join(parse_bits))
   return root
 
 def tree_from_shp(text, allow_empty_labels=False, allow_empty_words=False):
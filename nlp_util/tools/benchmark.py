@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 noet:
+'''Time core operations on a treebank, comparing the alternative
+implementations available in nlp_util.
+
+Executed as:
+	./benchmark.py <benchmark> <file>
+
+Benchmarks:
+	read     Reading a PTB file, a character at a time and in bulk
+	parse    Constructing trees from text with pstree.tree_from_text
+	memory   Bytes per node, with slots and shared labels vs. a dictionary per node,
+	         and as a FrozenTree
+	crossing Classifying missing brackets as crossing or not in long sentences
+	         (100+ tokens), scanning all test brackets vs. the position index
+	boundaries
+	         Matching system mentions to gold mentions with slightly different
+	         boundaries, scanning all mentions vs. indexes (the file is a CoNLL
+	         coreference file, ideally with long documents)
+'''
+
+import sys, os, time, random
+from itertools import izip
+from collections import defaultdict
+try:
+	from nlp_util import init, pstree, treebanks, parse_errors, frozen_tree
+	from nlp_util import coreference, coreference_reading, coreference_rendering
+except ImportError:
+	raise Exception("Remember to either install nlp_util or set up a symlink to the nlp_util directory")
+
+def timed(func, *args):
+	start = time.time()
+	ans = func(*args)
+	return time.time() - start, ans
+
+def consume(trees):
+	count = 0
+	for tree in trees:
+		count += 1
+	return count
+
+def report(out, name, seconds, count, unit):
+	rate = count / seconds if seconds > 0 else float('inf')
+	print >> out, "{:<28} {:8.2f}s {:12.1f} {}/s".format(name, seconds, rate, unit)
+
+def bench_read(filename, out):
+	size = os.path.getsize(filename) / float(1 << 20)
+	read_char = lambda: treebanks.generate_trees(filename, allow_empty_labels=True)
+	read_bulk = lambda: treebanks.generate_trees(filename, allow_empty_labels=True, bulk=True)
+	for char_tree, bulk_tree in izip(read_char(), read_bulk()):
+		if repr(char_tree) != repr(bulk_tree):
+			print >> out, "Readers produced different trees"
+			break
+	char_time, count = timed(consume, read_char())
+	bulk_time, count = timed(consume, read_bulk())
+	report(out, "ptb_read_tree", char_time, size, 'MB')
+	report(out, "ptb_generate_trees", bulk_time, size, 'MB')
+	print >> out, "Trees: {}  Speedup: {:.2f}x".format(count, char_time / bulk_time)
+
+def bench_parse(filename, out):
+	texts = list(treebanks.ptb_generate_tree_text(open(filename)))
+	parse = lambda: [pstree.tree_from_text(text, True) for text in texts]
+	seconds, trees = timed(parse)
+	nodes = sum(len(list(tree)) for tree in trees)
+	report(out, "tree_from_text", seconds, len(texts), 'trees')
+	report(out, "tree_from_text", seconds, nodes, 'nodes')
+
+class DictNode:
+	'''A node that keeps its fields in an attribute dictionary, as PSTree did
+	before switching to slots.'''
+	def __init__(self, node):
+		self.word = node.word
+		self.label = node.label
+		self.span = node.span
+		self.wordspan = node.wordspan
+		self.parent = node.parent
+		self.subtrees = node.subtrees
+
+def bench_memory(filename, out):
+	nodes = 0
+	shared = 0
+	unshared = 0
+	frozen = 0
+	seen = set()
+	for tree in treebanks.generate_trees(filename, allow_empty_labels=True, bulk=True):
+		ftree = frozen_tree.freeze(tree)
+		frozen += sys.getsizeof(ftree)
+		for name in ftree.__slots__:
+			frozen += sys.getsizeof(getattr(ftree, name))
+		for node in tree:
+			nodes += 1
+			fields = sys.getsizeof(node.subtrees) + sys.getsizeof(node.span)
+			if node.wordspan is not node.span:
+				fields += sys.getsizeof(node.wordspan)
+			shared += sys.getsizeof(node) + fields
+			if id(node.label) not in seen:
+				seen.add(id(node.label))
+				shared += sys.getsizeof(node.label)
+			dict_node = DictNode(node)
+			unshared += sys.getsizeof(dict_node) + sys.getsizeof(dict_node.__dict__) + fields
+			unshared += sys.getsizeof(node.label)
+	print >> out, "Nodes: {}  Distinct label objects: {}".format(nodes, len(seen))
+	print >> out, "{:<28} {:8.1f} bytes/node".format("dictionary, unshared labels", unshared / float(nodes))
+	print >> out, "{:<28} {:8.1f} bytes/node".format("slots, shared labels", shared / float(nodes))
+	print >> out, "{:<28} {:8.1f} bytes/node".format("FrozenTree", frozen / float(nodes))
+
+def shift_brackets(tree, rand):
+	'''Make a copy of the tree with errors, by joining the first subtree of nodes
+	with part of their second subtree, and by flattening nodes.'''
+	tree = tree.clone()
+	for node in list(tree):
+		if len(node.subtrees) > 1 and len(node.subtrees[1].subtrees) > 1 and rand.random() < 0.3:
+			first = node.subtrees[0]
+			second = node.subtrees[1]
+			moved = second.subtrees.pop(0)
+			joined = pstree.PSTree(None, first.label, None, node, [first, moved])
+			first.parent = joined
+			moved.parent = joined
+			node.subtrees[0] = joined
+		elif node.parent is not None and len(node.subtrees) > 0 and rand.random() < 0.1:
+			pos = node.parent.subtrees.index(node)
+			for subtree in node.subtrees:
+				subtree.parent = node.parent
+			node.parent.subtrees[pos:pos + 1] = node.subtrees
+	tree.calculate_spans()
+	return tree
+
+def scan_crossing(key, test_spans):
+	# How get_errors used to check for crossing brackets
+	for tkey, tspan in test_spans:
+		if tkey[0] < key[0] < tkey[1] < key[1]:
+			return True
+		elif key[0] < tkey[0] < key[1] < tkey[1]:
+			return True
+	return False
+
+def bench_crossing(filename, out, min_length=100):
+	rand = random.Random(0)
+	pairs = []
+	for gold in treebanks.generate_trees(filename, allow_empty_labels=True, bulk=True):
+		if gold.span[1] >= min_length:
+			test = shift_brackets(gold, rand)
+			gold_spans = parse_errors.get_brackets(gold)[0]
+			test_spans = parse_errors.get_brackets(test)[0]
+			test_keys = set([key for key, span in test_spans])
+			missing = [key for key, span in gold_spans if key not in test_keys]
+			pairs.append((missing, test_spans, gold.span[1]))
+	def scan():
+		return [[scan_crossing(key, test_spans) for key in missing] for missing, test_spans, length in pairs]
+	def index():
+		ans = []
+		for missing, test_spans, length in pairs:
+			crossing_index = parse_errors.get_crossing_index(test_spans, length)
+			ans.append([parse_errors.crosses(crossing_index, key[0], key[1]) for key in missing])
+		return ans
+	scan_time, scan_ans = timed(scan)
+	index_time, index_ans = timed(index)
+	if scan_ans != index_ans:
+		print >> out, "Methods classified brackets differently"
+	brackets = sum([len(missing) for missing, test_spans, length in pairs])
+	crossing = sum([sum(sent) for sent in index_ans])
+	print >> out, "Sentences: {}  Missing brackets: {}  Crossing: {}".format(len(pairs), brackets, crossing)
+	report(out, "scan test brackets", scan_time, brackets, 'brackets')
+	report(out, "position index", index_time, brackets, 'brackets')
+	print >> out, "Speedup: {:.2f}x".format(scan_time / index_time)
+
+def shift_mentions(clusters, text, rand):
+	'''Make system output from gold clusters, by adding a word to either end of
+	some mentions, dropping some, and moving some to other clusters.'''
+	mentions = {}
+	auto_clusters = defaultdict(lambda: [])
+	cluster_ids = clusters.keys()
+	for cluster_id in clusters:
+		for sentence, start, end in clusters[cluster_id]:
+			value = rand.random()
+			if value < 0.2:
+				start = max(0, start - 1)
+			elif value < 0.4:
+				end = min(len(text[sentence]), end + 1)
+			elif value < 0.45:
+				continue
+			auto_id = cluster_id
+			if rand.random() < 0.1:
+				auto_id = rand.choice(cluster_ids)
+			if (sentence, start, end) not in mentions:
+				mentions[sentence, start, end] = auto_id
+				auto_clusters[auto_id].append((sentence, start, end))
+	return mentions, auto_clusters
+
+class ClusterScan:
+	'''Finds the cluster containing a mention by checking every cluster, as
+	match_boundaries used to, in place of its mention to cluster index.'''
+	def __init__(self, clusters):
+		self.clusters = clusters
+
+	def pop(self, mention):
+		ans = None
+		for cluster in self.clusters:
+			if mention in cluster:
+				ans = cluster
+		return ans
+
+	def __setitem__(self, mention, cluster):
+		pass
+
+def scan_match_trimmed(unique_to_gold, unique_to_auto, text):
+	# How match_boundaries used to match trimmed mentions, comparing every
+	# system mention with every gold mention
+	mapping = {}
+	used_gold = set()
+	for amention in unique_to_auto:
+		trimmed = coreference_rendering.trim_mention(text, amention)
+		for gmention in unique_to_gold:
+			if gmention[0] != amention[0] or gmention in used_gold:
+				continue
+			if coreference_rendering.trim_mention(text, gmention) == trimmed:
+				mapping[amention] = gmention
+				used_gold.add(gmention)
+	return mapping
+
+def scan_match_boundaries(gold_mention_set, auto_mention_set, auto_mentions, auto_clusters, auto_cluster_set, text, parses, heads):
+	unique_to_gold = gold_mention_set.difference(auto_mention_set)
+	unique_to_auto = auto_mention_set.difference(gold_mention_set)
+	mapping = scan_match_trimmed(unique_to_gold, unique_to_auto, text)
+	coreference_rendering.remap_mentions(mapping, auto_mention_set, auto_mentions, auto_clusters, auto_cluster_set, ClusterScan(auto_cluster_set))
+	mapping = coreference_rendering.match_head_mentions(gold_mention_set, auto_mention_set, text, parses, heads)
+	coreference_rendering.remap_mentions(mapping, auto_mention_set, auto_mentions, auto_clusters, auto_cluster_set, ClusterScan(auto_cluster_set))
+
+def bench_boundaries(filename, out):
+	rand = random.Random(0)
+	parts = []
+	for doc, part, info in coreference_reading.generate_conll_parts(filename, rner=False):
+		info = info.evaluate()
+		auto_mentions, auto_clusters = shift_mentions(info['clusters'], info['text'], rand)
+		gold_mention_set = coreference.set_of_mentions(info['clusters'])
+		parts.append((gold_mention_set, auto_mentions, auto_clusters, info))
+	def run(func):
+		ans = []
+		for gold_mention_set, auto_mentions, auto_clusters, info in parts:
+			auto_mentions = dict(auto_mentions)
+			auto_clusters = dict((key, list(value)) for key, value in auto_clusters.items())
+			auto_mention_set = set(auto_mentions)
+			auto_cluster_set = coreference.set_of_clusters(auto_clusters)
+			func(gold_mention_set, auto_mention_set, auto_mentions, auto_clusters, auto_cluster_set, info['text'], info['parses'], info['heads'])
+			ans.append((auto_mention_set, auto_mentions, auto_clusters, auto_cluster_set))
+		return ans
+	scan_time, scan_ans = timed(run, scan_match_boundaries)
+	index_time, index_ans = timed(run, coreference_rendering.match_boundaries)
+	if scan_ans != index_ans:
+		print >> out, "Methods matched mentions differently"
+	mentions = sum([len(auto_mentions) for gold_mention_set, auto_mentions, auto_clusters, info in parts])
+	largest = max([len(gold_mention_set) for gold_mention_set, auto_mentions, auto_clusters, info in parts])
+	print >> out, "Parts: {}  System mentions: {}  Most gold mentions in a part: {}".format(len(parts), mentions, largest)
+	report(out, "scan mentions and clusters", scan_time, mentions, 'mentions')
+	report(out, "mention indexes", index_time, mentions, 'mentions')
+	print >> out, "Speedup: {:.2f}x".format(scan_time / index_time)
+
+benchmarks = {
+	'read': bench_read,
+	'parse': bench_parse,
+	'memory': bench_memory,
+	'crossing': bench_crossing,
+	'boundaries': bench_boundaries,
+}
+
+if __name__ == '__main__':
+	init.argcheck(sys.argv, 3, 3, "Time core operations on a treebank", "<[{}]> <file>".format(','.join(benchmarks.keys())))
+	if sys.argv[1] not in benchmarks:
+		print >> sys.stderr, "Invalid benchmark.  Valid options are:"
+		print >> sys.stderr, '\n'.join(benchmarks.keys())
+		sys.exit(1)
+	init.header(sys.argv)
+	benchmarks[sys.argv[1]](sys.argv[2], sys.stdout)
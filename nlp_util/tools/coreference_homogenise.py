@@ -106,7 +106,7 @@ if __name__ == '__main__':
 		'stanford': read_stanford,
 		'uiuc': read_uiuc
 	}
-	init.argcheck(sys.argv, 5, 6, "Translate a system output into the CoNLL format", "<prefix> <[{}]> <dir | file> <gold dir>".format(','.join(formats.keys())))
+	init.argcheck(sys.argv, 5, 6, "Translate a system output into the CoNLL format", "<prefix> <[{}]> <dir | file> <gold dir> [gold index file]".format(','.join(formats.keys())))
 
 	out = open(sys.argv[1] + '.out', 'w')
 	log = open(sys.argv[1] + '.log', 'w')
@@ -114,6 +114,9 @@ if __name__ == '__main__':
 
 	auto_src = sys.argv[3]
 	gold_src = sys.argv[4]
+	if len(sys.argv) > 5:
+		# Keep the index of gold files between runs
+		coreference_reading.conll_index(gold_src, cache=sys.argv[5])
 	if sys.argv[2] not in formats:
 		print "Invalid format.  Valid options are:"
 		print '\n'.join(formats.keys())
@@ -6,9 +6,9 @@
 
 from __future__ import print_function
 
-import sys
+import sys, itertools
 
-from nlp_util import pstree, nlp_eval, treebanks, parse_errors, init
+from nlp_util import nlp_eval, treebanks, evalb, init
 
 options = {
 	# 'option_word': ((valid options or type), default, "Long description"),
@@ -18,46 +18,35 @@ options = {
 	# Input
 	"gold": [str, "-", # TODO - part
 		"The file containing gold trees, if '-', stdin is used"],
-	"test": [str, "-", # TODO - part
-		"The file containing system produced trees, if '-', stdin is used"],
+	"test": [[str], ["-"], # TODO - part
+		"The files containing system produced trees, if '-', stdin is used.  When"
+		"several are given, the gold trees are read and modified once, and a"
+		"summary is printed for each system"],
 	"gold_input": [('ptb', 'ontonotes'), 'ptb',
 		"Input format for the gold file: PTB (single or multiple lines per parse),"
 		"OntoNotes (one file in all cases)"],
 	"test_input": [('ptb', 'ontonotes'), 'ptb',
 		"Input format for the test file: PTB (single or multiple lines per parse),"
 		"OntoNotes (one file in all cases)"],
-	# Scoring modification
+	# Output
+	"significance_samples": [int, 0,
+		"With several systems, the number of samples for tests of the"
+		"significance of differences in F-score from the first system (a paired"
+		"bootstrap and approximate randomization, which need NumPy), 0 for none"],
+}
+# Scoring, tree modification and execution options are those of evaluation
+for name in evalb.options:
+	options[name] = list(evalb.options[name])
+# Not implemented yet, so only the defaults are accepted
+unimplemented = {
 	"labelled_score": [bool, True, # TODO
 		"Labeled or unlabelled score"],
-	"include_POS_in_score": [bool, False,
-		"Include POS tags in overall score"],
-	"include_unparsed_in_score": [bool, True,
-		"Include missed sentences in overall score"],
-	"summary_cutoffs": [[int], [40], # TODO
-		"Cutoff lengths for summaries"],
 	"averaging": [('macro', 'micro'), 'macro', # TODO
 		"How to calculate the overall scores, with a macro average (score for sums"
 		"of counts) or micro average (average of scores for each count)"],
-	# Tree modification
-	"remove_trivial_unaries": [bool, True,
-		"Remove unaries that go from a label to iself,"
-		"e.g. (NP (NP (NNP it))) has one"],
-	"remove_function_labels": [bool, True,
-		"Remove function labels, e.g. NP-TMP, remove the -TMP part"],
-	"homogenise_top_label": [bool, True,
-		"Homogenise the top labels, so all are ROOT"],
-	"labels_to_remove": [[str],
-		["TOP", "ROOT", "S1", "-NONE-", ",", ":", "``", "''", "."],
-		"Remove nodes with the given labels, keep subtrees, but remove"
-		"parents that now have a span of size 0"],
-	"words_to_remove": [[str], [],
-		"Remove nodes with the given words, and do as for labels"],
-	"equivalent_labels": [[(str, str)], [("ADVP", "PRT")],
-		"Labels to treat as equivalent"],
-	"equivalent_words": [[(str, str)], [],
-		"Words to treat as equivalent"],
 }
-
+for name in unimplemented:
+	options[name] = list(unimplemented[name])
 
 # Provide current execution info
 out = sys.stdout
@@ -65,28 +54,55 @@ init.header(sys.argv, out)
 
 
 # Handle options
-test_in = None
-gold_in = None
-if len(sys.argv) == 1:
+def set_option(arg):
+	'''Set an option given as --name=value, for options with a simple type.'''
+	name, value = arg[2:].split('=', 1)
+	if name not in options:
+		print("Unknown option: {}".format(name), file=sys.stderr)
+		sys.exit(1)
+	try:
+		options[name][1] = evalb.parse_option_value(options[name][0], value)
+	except Exception:
+		print("Invalid value for {}: {}".format(name, value), file=sys.stderr)
+		sys.exit(1)
+	if name in unimplemented and options[name][1] != unimplemented[name][1]:
+		print("Option not implemented yet: {}".format(name), file=sys.stderr)
+		sys.exit(1)
+
+args = []
+for arg in sys.argv[1:]:
+	if arg.startswith('--') and '=' in arg:
+		set_option(arg)
+	else:
+		args.append(arg)
+if len(args) < 2:
 	# TODO
-	sys.exit()
-elif len(sys.argv) == 2:
-	# TODO
-	sys.exit()
-elif len(sys.argv) == 3:
-	# Run with defaults, assume the two arguments are the gold and test files
-	options['gold'][1] = sys.argv[1]
-	options['test'][1] = sys.argv[2]
+	print("Usage:\n  {} [--option=value ...] <gold> <test> [<test> ...]".format(sys.argv[0]), file=sys.stderr)
+	sys.exit(1)
 else:
-	# TODO
-	sys.exit()
+	# Assume the arguments are the gold file and one or more test files
+	options['gold'][1] = args[0]
+	options['test'][1] = args[1:]
 
 # Print list of options in use
 for option in options:
 	print("# {: <28} : {}".format(option, str(options[option][1])))
 
 # Set up reading
-test_in = open(options['test'][1])
+def read_items(source, tree_reader):
+	'''Yield trees from the file, or for PTB files just the text of each tree,
+	leaving construction to the scoring.'''
+	if tree_reader == treebanks.ptb_read_tree:
+		for text in treebanks.ptb_generate_tree_text(source, True, True):
+			yield text
+	else:
+		while True:
+			tree = tree_reader(source, True, True, True, True)
+			if tree is None:
+				return
+			yield tree
+
+test_ins = [open(name) for name in options['test'][1]]
 test_tree_reader = treebanks.ptb_read_tree
 if options["test_input"][1] == 'ontonotes':
 	test_tree_reader = treebanks.conll_read_tree
@@ -96,126 +112,112 @@ gold_tree_reader = treebanks.ptb_read_tree
 if options["gold_input"][1] == 'ontonotes':
 	gold_tree_reader = treebanks.conll_read_tree
 
+# With several systems only the summary for each is printed
+multi_system = len(test_ins) > 1
 header = '''
 Sentence                          Matched   Bracket    Cross  Correct  Tag
 ID    Len    P       R       F    Bracket  gold test  Bracket  Tags  Accracy
 ============================================================================'''
-print(header, file=out)
-
-# Process sentences
-scores = []
+if not multi_system:
+	print(header, file=out)
+
+def sentence_line(result):
+	if 'error' in result:
+		return result['error']
+	return "{id:4} {length:4} {p: >7.2f} {r: >7.2f} {f: >7.2f} {match:5} {gold:6}" \
+		" {test:4} {crossing:7} {POS:7} {POS_acc: >8.2f}".format(**result)
+
+# Process sentences, with results always handled in sentence order
+eval_options = evalb.option_values(dict((name, options[name][1]) for name in evalb.options))
+test_items = itertools.izip(*[read_items(test_in, test_tree_reader) for test_in in test_ins])
+results = evalb.score_sentences(read_items(gold_in, gold_tree_reader), test_items, eval_options)
+summaries = [nlp_eval.EvalbSummary(eval_options["include_unparsed_in_score"],
+	eval_options["summary_cutoffs"]) for test_in in test_ins]
+# Per-sentence counts are only kept when they are needed for significance tests
+keep_counts = multi_system and options['significance_samples'][1] > 0
+sentence_counts = [[] for test_in in test_ins]
 sent_id = 0
-while True:
+for sentence in results:
 	sent_id += 1
+	for system, result in enumerate(sentence):
+		if not multi_system:
+			print(sentence_line(result), file=out)
+		elif 'error' in result:
+			print("{}: sentence {}: {}".format(options['test'][1][system],
+				result['id'], result['error']), file=sys.stderr)
+		evalb.add_to_summary(summaries[system], result)
+		if keep_counts and 'error' not in result:
+			sentence_counts[system].append((result['id'], result['match'],
+				result['gold'], result['test'], result['crossing']))
+
+if multi_system:
+	# Print a row of the main scores for each system
+	print('''
+Number of sentence = {}
+System                          Valid   Recall  Precision  FMeasure  Complete  Tagging
+======================================================================================'''.format(sent_id), file=out)
+	for name, system_summary in zip(options['test'][1], summaries):
+		summary = system_summary.summary()
+		print("{:<30} {:6} {:8.2f} {:10.2f} {:9.2f} {:9.2f} {:8.2f}".format(name[-30:],
+			summary['parsed'], summary['r'], summary['p'], summary['f'],
+			summary['all_brackets_match'], summary['POS_acc']), file=out)
+
+	samples = options['significance_samples'][1]
+	if samples > 0:
+		# Imported here so that NumPy is only needed for significance tests
+		from nlp_util import eval_stats
+		def system_counts(counts, sent_ids):
+			counts = [count for count in counts if count[0] in sent_ids]
+			return eval_stats.Counts([count[1] for count in counts],
+				[count[2] for count in counts], [count[3] for count in counts],
+				[count[4] for count in counts])
+
+		print('''
+Significance of FMeasure differences from {}, with {} samples
+System                          Difference  Bootstrap p  Randomization p
+========================================================================'''.format(
+			options['test'][1][0][-30:], samples), file=out)
+		first_ids = set([count[0] for count in sentence_counts[0]])
+		for name, counts in zip(options['test'][1][1:], sentence_counts[1:]):
+			# Only sentences scored for both systems are compared
+			sent_ids = first_ids.intersection([count[0] for count in counts])
+			first = system_counts(sentence_counts[0], sent_ids)
+			system = system_counts(counts, sent_ids)
+			difference, random_p = eval_stats.approximate_randomization(system, first, samples)
+			# The bootstrap tests whether the better system is better
+			if difference >= 0:
+				bootstrap_p = eval_stats.paired_bootstrap(system, first, samples)[1]
+			else:
+				bootstrap_p = eval_stats.paired_bootstrap(first, system, samples)[1]
+			print("{:<30} {:12.2f} {:12.4f} {:16.4f}".format(name[-30:], difference * 100,
+				bootstrap_p, random_p), file=out)
+	sys.exit()
 
-	# Read trees
-	test_tree = test_tree_reader(test_in, True, True, True, True)
-	gold_tree = gold_tree_reader(gold_in, True, True, True, True)
-	if test_tree is None or gold_tree is None:
-		break
-	if test_tree == "Empty":
-		test_tree = None
-
-	# Coverage error
-	gwords = len(gold_tree.word_yield().split())
-	if test_tree is None:
-		match, gcount, tcount, crossing, POS = parse_errors.counts_for_prf(gold_tree,
-			gold_tree, include_terminals=options['include_POS_in_score'][1])
-		scores.append((sent_id, twords, 0, 0, 0, 0, gcount, 0, 0, 0, 0))
-		print("{:4} {:4} {: >7.2f} {: >7.2f} {: >7.2f} {:5} {:6} {:4} {:7}"
-			" {:7} {: >8.2f}".format(sent_id, gwords, 0, 0, 0, 0, gcount, 0, 0, 0, 0))
-		continue
-
-	# Simple check for consistency
-	twords = len(test_tree.word_yield().split())
-	if twords != gwords:
-		print("Sentence lengths do not match: {} {}".format(twords, gwords))
-		continue
-
-	# Modify as per options
-	if options["remove_function_labels"][1]:
-		treebanks.remove_function_tags(test_tree)
-		treebanks.remove_function_tags(gold_tree)
-	if options["homogenise_top_label"][1]:
-		test_tree = treebanks.homogenise_tree(test_tree)
-		gold_tree = treebanks.homogenise_tree(gold_tree)
-	if len(options['labels_to_remove'][1]) > 0:
-		treebanks.remove_nodes(test_tree, lambda(n): n.label in options['labels_to_remove'][1], True, True)
-		treebanks.remove_nodes(gold_tree, lambda(n): n.label in options['labels_to_remove'][1], True, True)
-	if len(options['words_to_remove'][1]) > 0:
-		treebanks.remove_nodes(test_tree, lambda(n): n.word in options['words_to_remove'][1], True, True)
-		treebanks.remove_nodes(gold_tree, lambda(n): n.word in options['words_to_remove'][1], True, True)
-	if len(options['equivalent_labels'][1]) > 0:
-		for tree in [gold_tree, test_tree]:
-			for node in gold_tree:
-				for pair in options['equivalent_labels'][1]:
-					if node.label in pair:
-						node.label = pair[0]
-	if len(options['equivalent_words'][1]) > 0:
-		for tree in [gold_tree, test_tree]:
-			for node in gold_tree:
-				for pair in options['equivalent_words'][1]:
-					if node.word in pair:
-						node.word = pair[0]
-	if options['remove_trivial_unaries'][1]:
-		treebanks.remove_trivial_unaries(test_tree)
-		treebanks.remove_trivial_unaries(gold_tree)
-
-	# Score and report
-	match, gcount, tcount, crossing, POS = parse_errors.counts_for_prf(test_tree,
-		gold_tree, include_terminals=options['include_POS_in_score'][1])
-	POS = twords - POS
-	p, r, f = nlp_eval.calc_prf(match, gcount, tcount)
-	f *= 100
-	r *= 100
-	p *= 100
-	POS_acc = 100.0 * POS / twords
-
-	print("{:4} {:4} {: >7.2f} {: >7.2f} {: >7.2f} {:5} {:6} {:4} {:7}"
-		" {:7} {: >8.2f}".format(sent_id, gwords, p, r, f, match, gcount, tcount, crossing, POS, POS_acc))
-	scores.append((sent_id, gwords, p, r, f, match, gcount, tcount, crossing, POS, POS_acc))
-sent_id -= 1
-
-# Work out summary
-sents = float(sent_id)
-parsed = len(filter(lambda x: x[7] != 0, scores))
-if not options["include_unparsed_in_score"][1]:
-	scores = filter(lambda x: x[7] > 0, scores)
-	sents = float(parsed)
-words = sum([val[1] for val in scores])
-match = sum([val[5] for val in scores])
-gcount = sum([val[6] for val in scores])
-tcount = sum([val[7] for val in scores])
-crossing = sum([val[8] for val in scores])
-POS = sum([val[9] for val in scores])
-p, r, f = nlp_eval.calc_prf(match, gcount, tcount)
-f *= 100
-r *= 100
-p *= 100
-POS_acc = 100.0 * POS / words
-skipped = len(filter(lambda x: x[7] == 0, scores))
-all_brackets_match = 100.0 * len(filter(lambda x: x[7] == x[6] == x[5], scores)) / sents
-perfect = 100.0 * len(filter(lambda x: x[7] == x[6] == x[5] and x[1] == x[9], scores)) / sents
-av_crossing = float(crossing) / sents
-no_crossing = 100.0 * len(filter(lambda x: x[8] == 0, scores)) / sents
-max2_crossing = 100.0 * len(filter(lambda x: x[8] <= 2, scores)) / sents
+summary = summaries[0].summary()
 
 # Print Summary
 print("============================================================================")
 print("{:4} {:4} {: >7.2f} {: >7.2f} {: >7.2f} {:5} {:6} {:4} {:7}"
-		" {:7} {: >8.2f}".format(sent_id, words, p, r, f, match, gcount, tcount, crossing, POS, POS_acc))
-print('''=== Summary ===
-
--- All --''')
-print("Number of sentence        = {:6}".format(sent_id))
-print("Number of Skip  sentence  = {:6}".format(skipped))
-print("Number of Valid sentence  = {:6}".format(parsed))
-print("Bracketing Recall         = {:6.2f}".format(r))
-print("Bracketing Precision      = {:6.2f}".format(p))
-print("Bracketing FMeasure       = {:6.2f}".format(f))
-print("Complete match            = {:6.2f}".format(all_brackets_match))
-print("Perfect (match POS too)   = {:6.2f}".format(perfect))
-print("Average crossing          = {:6.2f}".format(av_crossing))
-print("No crossing               = {:6.2f}".format(no_crossing))
-print("2 or less crossing        = {:6.2f}".format(max2_crossing))
-print("Tagging accuracy          = {:6.2f}".format(sent_id)) #  93.66
+		" {:7} {: >8.2f}".format(sent_id, summary['words'], summary['p'], summary['r'],
+		summary['f'], summary['match'], summary['gcount'], summary['tcount'],
+		summary['crossing'], summary['POS'], summary['POS_acc']))
+print('''=== Summary ===''')
+
+def print_summary(title, summary):
+	print("\n-- {} --".format(title))
+	print("Number of sentence        = {:6}".format(summary['sentences']))
+	print("Number of Skip  sentence  = {:6}".format(summary['skipped']))
+	print("Number of Valid sentence  = {:6}".format(summary['parsed']))
+	print("Bracketing Recall         = {:6.2f}".format(summary['r']))
+	print("Bracketing Precision      = {:6.2f}".format(summary['p']))
+	print("Bracketing FMeasure       = {:6.2f}".format(summary['f']))
+	print("Complete match            = {:6.2f}".format(summary['all_brackets_match']))
+	print("Perfect (match POS too)   = {:6.2f}".format(summary['perfect']))
+	print("Average crossing          = {:6.2f}".format(summary['av_crossing']))
+	print("No crossing               = {:6.2f}".format(summary['no_crossing']))
+	print("2 or less crossing        = {:6.2f}".format(summary['max2_crossing']))
+	print("Tagging accuracy          = {:6.2f}".format(summary['POS_acc']))
+
+print_summary("All", summary)
+for cutoff, cutoff_summary in summaries[0].cutoffs:
+	print_summary("len<={}".format(cutoff), cutoff_summary.summary())
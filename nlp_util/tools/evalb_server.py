@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 noet:
+
+'''A local server for scoring many sets of parses against the same gold
+trees, e.g. for the checkpoints of a parameter sweep.  The gold trees are read
+and modified once, when the server starts.  Test trees are sent as the body of
+a POST request, in PTB format, and the scores are returned as JSON (with the
+result for each sentence if the path is /sentences).  Results are cached by a
+hash of the test text, so sending the same parses again costs nothing.
+
+To start the server, and score a file:
+
+  python -m nlp_util.tools.evalb_server [--option=value ...] <gold> [port]
+  curl --data-binary @test.mrg http://localhost:8631/
+
+Options are those of nlp_util.evalb, apart from processes.'''
+
+from __future__ import print_function
+
+import sys, json, hashlib, itertools, urllib2
+from collections import OrderedDict
+from StringIO import StringIO
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from nlp_util import nlp_eval, treebanks, evalb, init
+
+DEFAULT_PORT = 8631
+
+class Scorer:
+	'''Scores sets of test trees against gold trees prepared in advance, with a
+	cache of the results for the most recent cache_size sets.'''
+	def __init__(self, gold_items, options=None, cache_size=1000):
+		self.options = evalb.option_values(options)
+		self.gold = [evalb.prepare_gold(item, self.options) for item in gold_items]
+		self.cache = OrderedDict()
+		self.cache_size = cache_size
+
+	def score(self, text):
+		'''Score the trees in the given PTB text, returning the results as for
+		evalb.evaluate.  Raises an exception if there are more trees than gold
+		trees.'''
+		key = hashlib.sha1(text).hexdigest()
+		if key in self.cache:
+			# Move to the end, so that the least recently used is removed first
+			results = self.cache.pop(key)
+			self.cache[key] = results
+			return results
+
+		summary = nlp_eval.EvalbSummary(self.options['include_unparsed_in_score'],
+			self.options['summary_cutoffs'])
+		sentences = []
+		test_items = treebanks.ptb_generate_tree_text(StringIO(text), True, True, offsets=True)
+		for sent_id, gold, (test_item, start, end) in itertools.izip(itertools.count(1), self.gold, test_items):
+			result = evalb.score_test(sent_id, gold, test_item, self.options)
+			sentences.append(result)
+			evalb.add_to_summary(summary, result)
+		# Blank lines may follow the last sentence, but further trees are an error
+		for test_item, start, end in test_items:
+			if text[start:end].strip() != '':
+				raise Exception("More test trees than gold trees ({})".format(len(self.gold)))
+		# Missing sentences at the end of the test text count as unparsed
+		for sent_id in xrange(len(sentences) + 1, len(self.gold) + 1):
+			result = evalb.score_test(sent_id, self.gold[sent_id - 1], None, self.options)
+			sentences.append(result)
+			evalb.add_to_summary(summary, result)
+		results = {'sentences': sentences, 'summary': summary.summary(),
+			'cutoffs': [(cutoff, cutoff_summary.summary()) for cutoff, cutoff_summary in summary.cutoffs]}
+
+		self.cache[key] = results
+		if len(self.cache) > self.cache_size:
+			self.cache.popitem(False)
+		return results
+
+class ScoreHandler(BaseHTTPRequestHandler):
+	def do_POST(self):
+		length = int(self.headers.getheader('content-length', 0))
+		text = self.rfile.read(length)
+		try:
+			results = self.server.scorer.score(text)
+		except Exception as error:
+			self.send_error(400, str(error))
+			return
+		if self.path.rstrip('/') != '/sentences':
+			results = {'summary': results['summary'], 'cutoffs': results['cutoffs']}
+		body = json.dumps(results)
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		print("# " + format % args, file=sys.stderr)
+
+def serve(scorer, port=DEFAULT_PORT):
+	'''Handle requests until interrupted, only accepting local connections.'''
+	server = HTTPServer(('127.0.0.1', port), ScoreHandler)
+	server.scorer = scorer
+	server.serve_forever()
+
+def request_scores(text, port=DEFAULT_PORT, sentences=False):
+	'''Send test trees (PTB text) to a running server, and return its results.'''
+	url = 'http://127.0.0.1:{}/'.format(port)
+	if sentences:
+		url += 'sentences'
+	return json.loads(urllib2.urlopen(url, text).read())
+
+if __name__ == '__main__':
+	options = {}
+	args = []
+	for arg in sys.argv[1:]:
+		if arg.startswith('--') and '=' in arg:
+			name, value = arg[2:].split('=', 1)
+			if name not in evalb.options or name == 'processes':
+				print("Unknown option: {}".format(name), file=sys.stderr)
+				sys.exit(1)
+			options[name] = evalb.parse_option_value(evalb.options[name][0], value)
+		else:
+			args.append(arg)
+	if not 1 <= len(args) <= 2:
+		print(__doc__, file=sys.stderr)
+		sys.exit(1)
+	init.header(sys.argv, sys.stderr)
+
+	gold_items = list(treebanks.ptb_generate_tree_text(open(args[0]), True, True))
+	scorer = Scorer(gold_items, options)
+	port = DEFAULT_PORT
+	if len(args) > 1:
+		port = int(args[1])
+	print("# Serving scores for {} gold trees on port {}".format(len(scorer.gold), port), file=sys.stderr)
+	serve(scorer, port)
@@ -12,12 +12,13 @@ if __name__ == '__main__':
 	init.argcheck(sys.argv, 3, 3, "Print conll text", "<prefix> <data>")
 
 	prefix = sys.argv[1]
-	data = coreference_reading.read_all(sys.argv[2])
+	# Only the text is needed, and parts are written as they are read
+	parts = coreference_reading.generate_conll_all(sys.argv[2], rparses=False, rheads=False, rclusters=False, rner=False)
 
-	for doc in data:
-		for part in data[doc]:
-			text = data[doc][part]['text']
-			filename = '__'.join(doc.split('/') + [part])
-			out = open(prefix + filename, 'w')
-			for line in text:
-				print >> out, ' '.join(line)
+	for doc, part, info in parts:
+		text = info['text']
+		filename = '__'.join(doc.split('/') + [part])
+		out = open(prefix + filename, 'w')
+		for line in text:
+			print >> out, ' '.join(line)
+		out.close()
@@ -3,7 +3,7 @@
 # vim: set ts=2 sw=2 noet:
 
 import sys
-from nlp_util import pstree, render_tree, nlp_eval, treebanks, parse_errors
+from nlp_util import pstree, render_tree, nlp_eval, treebanks, parse_errors, lazy_treebank
 
 def mprint(text, out_dict, out_name):
 	all_stdout = True
@@ -19,11 +19,61 @@ def mprint(text, out_dict, out_name):
 	else:
 		print >> out_dict[out_name], text
 
+def read_lines(gold_in, test_in, out):
+	'''Yield the sentence number and text of each pair of trees (one per line).'''
+	sent_no = 0
+	while True:
+		sent_no += 1
+		gold_text = gold_in.readline()
+		test_text = test_in.readline()
+		if gold_text == '' and test_text == '':
+			mprint("End of both input files", out, 'err')
+			break
+		elif gold_text == '':
+			mprint("End of gold input", out, 'err')
+			break
+		elif test_text == '':
+			mprint("End of test input", out, 'err')
+			break
+		yield sent_no, gold_text, test_text
+
+def read_selected(gold_file, test_file, sent_nos, index_dir=None):
+	'''Yield the sentence number and text of the given pairs of trees, without
+	reading the rest of the files.  Sentences are lines, as for read_lines, so
+	the numbers match.  If index_dir is given, the positions of lines are saved
+	there for later runs.
+
+	>>> import os, tempfile
+	>>> from StringIO import StringIO
+	>>> gold_file, test_file = tempfile.mktemp(), tempfile.mktemp()
+	>>> open(gold_file, 'w').write("\\n(S (NN a))\\n(S (NN b))\\n\\n\\n(S (NN c))\\n(S (NN d))\\n")
+	>>> open(test_file, 'w').write("\\n(S (NN a))\\n(())\\n\\n(S (NN x))\\n\\n(S (NN d))\\n")
+	>>> full = [(n, g.strip(), t.strip()) for n, g, t in read_lines(open(gold_file), open(test_file), {'err': StringIO()})]
+	>>> selected = list(read_selected(gold_file, test_file, range(1, 10)))
+	>>> selected == full
+	True
+	>>> selected[2]
+	(3, '(S (NN b))', '(())')
+	>>> list(read_selected(gold_file, test_file, [3, 7]))
+	[(3, '(S (NN b))', '(())'), (7, '(S (NN d))', '(S (NN d))')]
+	>>> os.remove(gold_file)
+	>>> os.remove(test_file)'''
+	gold = lazy_treebank.LazyTreebank(gold_file, one_per_line=True, index_dir=index_dir)
+	test = lazy_treebank.LazyTreebank(test_file, one_per_line=True, index_dir=index_dir)
+	for sent_no in sent_nos:
+		if sent_no > min(len(gold), len(test)):
+			break
+		gold_text = gold.get_text(sent_no - 1)
+		test_text = test.get_text(sent_no - 1)
+		yield sent_no, gold_text or '', test_text or ''
+
 
 if __name__ == '__main__':
-	if len(sys.argv) != 4:
+	if len(sys.argv) not in [4, 5, 6]:
 		print "Print trees with colours to indicate errors (red for extra, blue for missing, yellow for crossing missing)"
-		print "   %s <gold> <test> <output_prefix>" % sys.argv[0]
+		print "   %s <gold> <test> <output_prefix> [sentence numbers, e.g. 3,10-12] [index directory]" % sys.argv[0]
+		print "With an index directory, the positions of lines are saved there, to"
+		print "find sentences faster in later runs."
 		print "Running doctest"
 		import doctest
 		doctest.testmod()
@@ -38,9 +88,11 @@ if __name__ == '__main__':
 		prefix = sys.argv[3]
 		for key in out:
 			out[key] = open(prefix + '.' + key, 'w')
-	gold_in = open(sys.argv[1])
-	test_in = open(sys.argv[2])
-	sent_no = 0
+	if len(sys.argv) > 4:
+		index_dir = sys.argv[5] if len(sys.argv) > 5 else None
+		sentences = read_selected(sys.argv[1], sys.argv[2], lazy_treebank.parse_sentence_numbers(sys.argv[4]), index_dir)
+	else:
+		sentences = read_lines(open(sys.argv[1]), open(sys.argv[2]), out)
 	stats = {
 		'out': [0, 0, 0]
 	}
@@ -74,20 +126,7 @@ if __name__ == '__main__':
 \\maketitle'''
 	mprint(tex_start, out, 'tex')
 
-	while True:
-		sent_no += 1
-		gold_text = gold_in.readline()
-		test_text = test_in.readline()
-		if gold_text == '' and test_text == '':
-			mprint("End of both input files", out, 'err')
-			break
-		elif gold_text == '':
-			mprint("End of gold input", out, 'err')
-			break
-		elif test_text == '':
-			mprint("End of test input", out, 'err')
-			break
-
+	for sent_no, gold_text, test_text in sentences:
 		mprint("Sentence %d:" % sent_no, out, 'all')
 
 		gold_text = gold_text.strip()
@@ -3,7 +3,7 @@
 # vim: set ts=2 sw=2 noet:
 
 import sys
-from nlp_util import pstree, treebanks, render_tree
+from nlp_util import pstree, treebanks, render_tree, lazy_treebank
 
 #TODO print run information
 #TODO Add the ability to print multiple outputs in a single run, to dfferent files
@@ -59,12 +59,14 @@ def get_args():
 
 if __name__ == '__main__':
   if len(sys.argv) == 1:
-    print "Read trees from stdin and print them to stdout."
+    print "Read trees from stdin (or a file) and print them to stdout."
     print "Options:"
     print "  -(i)nput = (p)enn treebank | (c)onll | (s)plit head"
     print "  -(o)utput = (s)ingle_line [with (t)races] | (m)ulti_line [with (t)races] | (t)ex | (w)ords | (o)ntonotes | (p)os tagged | (h)ead automata"
     print "  -(e)dit = remove (t)races, remove (f)unction tags, apply (c)ollins rules, (h)omogenise top, remove trivial (u)naries"
     print "  -(g)old = <gold filenmae> (can be used by the tex output)"
+    print "  -(f)ile = <filename> (read trees from this file instead of stdin)"
+    print "  -(s)entences = <sentence numbers, e.g. 3,10-12> (only print these, needs -f and penn treebank input)"
     print "\ne.g. %s -o s -e tf < trees_in > trees_out" % sys.argv[0]
     sys.exit(0)
 
@@ -73,18 +75,37 @@ if __name__ == '__main__':
   out_format = args["o"] if 'o' in args else 's'
   edits = args["e"] if 'e' in args else ''
   gold_file = args["g"] if 'g' in args else None
+  in_file = args["f"] if 'f' in args else None
+  sentences = args["s"] if 's' in args else None
   read_func = treebanks.ptb_read_tree
   if 'c' in in_format:
     read_func = treebanks.conll_read_tree
   elif 's' in in_format:
     read_func = treebanks.shp_read_tree
 
-  if gold_file is not None:
-    gold_file = treebanks.generate_trees(gold_file, read_func, allow_empty_labels=True)
+  if sentences is not None:
+    if in_file is None or read_func != treebanks.ptb_read_tree:
+      print >> sys.stderr, "Selecting sentences needs a penn treebank file (-f)"
+      sys.exit(1)
+    # Only the selected trees are parsed, numbered as when reading every tree
+    test_trees = lazy_treebank.LazyTreebank(in_file, return_empty=True, allow_empty_labels=True)
+    sent_ids = [num - 1 for num in lazy_treebank.parse_sentence_numbers(sentences)]
+    sent_ids = [sent_id for sent_id in sent_ids if sent_id < len(test_trees)]
+    trees = test_trees.select(sent_ids)
+    if gold_file is not None:
+      gold_trees = lazy_treebank.LazyTreebank(gold_file, allow_empty_labels=True)
+      sent_ids = [sent_id for sent_id in sent_ids if sent_id < len(gold_trees)]
+      trees = test_trees.select(sent_ids)
+      gold_file = iter(gold_trees.select(sent_ids))
+  else:
+    source = sys.stdin if in_file is None else in_file
+    trees = treebanks.generate_trees(source, read_func, return_empty=True, allow_empty_labels=True)
+    if gold_file is not None:
+      gold_file = treebanks.generate_trees(gold_file, read_func, allow_empty_labels=True)
 
   if out_format == 't':
     print tex_start
-  for tree in treebanks.generate_trees(sys.stdin, read_func, return_empty=True, allow_empty_labels=True):
+  for tree in trees:
     gold_tree = None
     if gold_file is not None:
       gold_tree = gold_file.next()
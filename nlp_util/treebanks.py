@@ -1,8 +1,9 @@
 #!/usr/bin/env python
 
-import string
+import re, string, os, hashlib, types, functools
 
 from pstree import *
+import binary_treebank
 
 # TODO: Handle malformed input with trees that have random stuff instead of symbols
 # For chinese I found:
@@ -230,7 +231,7 @@ def remove_coindexation_from_label(label):
 
 def remove_coindexation(tree, in_place=True):
   '''Adjust the tree to remove coindexation info.'''
-  label = remove_coindexation_from_label(tree.label)
+  label = intern_label(remove_coindexation_from_label(tree.label))
   if in_place:
     for subtree in tree.subtrees:
       remove_coindexation(subtree, True)
@@ -254,7 +255,7 @@ def remove_function_tags(tree, in_place=True):
   >>> remove_function_tags(tree)
   (ROOT (S (NP (`` ``) (NP (NNP Funny) (NNP Business)) ('' '') (PRN (-LRB- -LRB-) (NP (NNP Soho)) (, ,) (NP (CD 228) (NNS pages)) (, ,) (NP ($ $) (CD 17.95)) (-RRB- -RRB-)) (PP (IN by) (NP (NNP Gary) (NNP Katzenstein)))) (VP (VBZ is) (NP (NP (NN anything)) (PP (RB but)))) (. .)))
   '''
-  label = split_label_type_and_function(tree.label)[0]
+  label = intern_label(split_label_type_and_function(tree.label)[0])
   if in_place:
     for subtree in tree.subtrees:
       remove_function_tags(subtree, True)
@@ -390,6 +391,88 @@ def ptb_read_tree(source, return_empty=False, allow_empty_labels=False, allow_em
   ptb_cleaning(tree)
   return tree
 
+BULK_CHUNK_SIZE = 1 << 20
+bracket_or_newline_re = re.compile('[()\n]')
+def ptb_generate_tree_text(source, return_empty=False, blank_line_coverage=False, chunk_size=BULK_CHUNK_SIZE, offsets=False):
+  '''Yield the text of each tree in the given PTB file, or "Empty" for empty
+  and missing parses (following the same rules as ptb_read_tree).  If offsets
+  is set, each text is yielded with the positions of its first character and
+  the character after it in the file.
+
+  Rather than reading a character at a time, the file is read in large chunks
+  and only brackets and newlines are inspected when finding tree boundaries.
+
+  >>> from StringIO import StringIO
+  >>> in_file = StringIO("(ROOT (NP (NNP Newspaper)))(ROOT\\n  (NP (NN paper)))\\n\\n(())\\n")
+  >>> for text in ptb_generate_tree_text(in_file, True, True, 8):
+  ...   print text
+  (ROOT (NP (NNP Newspaper)))
+  (ROOT   (NP (NN paper)))
+  Empty
+  Empty
+  >>> in_file.seek(0)
+  >>> for text, start, end in ptb_generate_tree_text(in_file, True, True, 8, True):
+  ...   print start, end
+  0 27
+  27 51
+  51 53
+  53 57'''
+  buf = ''
+  # Position of buf in the file
+  base = 0
+  start = 0
+  pos = 0
+  depth = 0
+  while True:
+    match = bracket_or_newline_re.search(buf, pos)
+    if match is None:
+      chunk = source.read(chunk_size)
+      if chunk == '':
+        return
+      base += start
+      buf = buf[start:] + chunk
+      pos = len(buf) - len(chunk)
+      start = 0
+      continue
+    pos = match.end()
+    char = match.group()
+    if char == '\n':
+      # A blank line after a tree, when the reader is tracking coverage
+      if blank_line_coverage and pos - start == 2 and buf[start] in ' \t\n':
+        if offsets:
+          yield "Empty", base + start, base + pos
+        else:
+          yield "Empty"
+        start = pos
+      continue
+    if char == '(':
+      depth += 1
+    else:
+      depth -= 1
+    if depth == 0:
+      text = buf[start:pos].replace('\n', ' ').replace('\t', ' ')
+      if '()' in text:
+        text = "Empty" if return_empty else None
+      elif '(' not in text:
+        text = None
+      if text is not None:
+        if offsets:
+          yield text, base + start, base + pos
+        else:
+          yield text
+      start = pos
+
+def ptb_generate_trees(source, return_empty=False, allow_empty_labels=False, allow_empty_words=False, blank_line_coverage=False, chunk_size=BULK_CHUNK_SIZE):
+  '''Read trees from the given PTB file, reading it in large chunks.  Trees are
+  yielded in the same form ptb_read_tree returns them (including "Empty").'''
+  for text in ptb_generate_tree_text(source, return_empty, blank_line_coverage, chunk_size):
+    if text == "Empty":
+      yield text
+      continue
+    tree = tree_from_text(text, allow_empty_labels, allow_empty_words)
+    ptb_cleaning(tree)
+    yield tree
+
 def shp_read_tree(source, return_empty=False, allow_empty_labels=False, allow_empty_words=False, blank_line_coverage=False):
   '''Read a single tree from the given file of split head grammar parses.
   
@@ -472,21 +555,143 @@ def conll_read_tree(source, return_empty=False, allow_empty_labels=False, allow_
     if line == '':
       break
     cur_text.append(line)
-  
-  text = ''
-  for line in cur_text:
-    if len(line) == 0 or line[0] == '#':
+  return conll_tree_from_lines(cur_text)
+
+def conll_tree_from_lines(lines):
+  '''Build the tree for the lines of one sentence of an OntoNotes data file,
+  skipping comments, straight from the word, POS and parse columns.'''
+  words = []
+  tags = []
+  parse_bits = []
+  for line in lines:
+    fields = line.split()
+    if len(fields) == 0 or fields[0][0] == '#':
       continue
-    line = line.split()
-    word = line[3]
-    pos = line[4]
-    tree = line[5]
-    tree = ' ('.join(tree.split('(')).split('*')
-    text += '%s(%s %s)%s' % (tree[0], pos, word, tree[1])
-  return tree_from_text(text)
-
-def generate_trees(source, tree_reader=ptb_read_tree, max_sents=-1, return_empty=False, allow_empty_labels=False, allow_empty_words=False):
+    words.append(fields[3])
+    tags.append(fields[4])
+    parse_bits.append(fields[5])
+  return tree_from_conll(words, tags, parse_bits)
+
+TREE_CACHE_VERSION = 3
+
+def code_key(code):
+  # Nested functions (e.g. lambdas inside the function) are code objects in
+  # the constants, and their repr includes an address, so they are expanded
+  consts = [code_key(const) if isinstance(const, types.CodeType) else repr(const) for const in code.co_consts]
+  return (code.co_code, consts, code.co_names)
+
+def function_key(func):
+  '''Identify a reader or transform for the tree cache by its name and code,
+  including default arguments and the values it uses from enclosing
+  functions, so that different lambdas, or an edited function, do not share
+  cached trees.  Functions it calls are not included.  For a functools.partial
+  the arguments are included too.  Other callables raise an exception, as
+  they cannot be identified reliably.
+
+  >>> function_key(lambda tree: tree) == function_key(lambda tree: tree)
+  True
+  >>> function_key(lambda tree: tree) == function_key(lambda tree: None)
+  False
+  >>> remove_labels = lambda labels: (lambda tree: remove_nodes(tree, lambda node: node.label in labels))
+  >>> function_key(remove_labels(['-NONE-'])) == function_key(remove_labels(['.']))
+  False
+  >>> function_key(functools.partial(remove_nodes, preserve_subtrees=True)) == function_key(functools.partial(remove_nodes, preserve_subtrees=False))
+  False'''
+  if isinstance(func, functools.partial):
+    return ('partial', function_key(func.func), repr(func.args), repr(sorted((func.keywords or {}).items())))
+  if not isinstance(func, types.FunctionType):
+    raise Exception("Cannot identify {!r} for the tree cache, use a function or functools.partial".format(func))
+  closure = []
+  if func.func_closure is not None:
+    for cell in func.func_closure:
+      value = cell.cell_contents
+      if isinstance(value, (types.FunctionType, functools.partial)):
+        closure.append(function_key(value))
+      else:
+        closure.append(repr(value))
+  return (func.__module__, func.__name__, code_key(func.func_code), repr(func.func_defaults), closure)
+
+def tree_cache_path(filename, cache_dir, tree_reader, options, transforms):
+  '''The cache file for trees read from filename with the given reader,
+  reading options and transformations (which are identified by their code,
+  see function_key).'''
+  content = hashlib.sha1()
+  source = open(filename, 'rb')
+  while True:
+    chunk = source.read(BULK_CHUNK_SIZE)
+    if chunk == '':
+      break
+    content.update(chunk)
+  source.close()
+  functions = [function_key(func) for func in [tree_reader] + list(transforms)]
+  settings = repr((TREE_CACHE_VERSION, content.hexdigest(), functions, options))
+  return os.path.join(cache_dir, hashlib.sha1(settings).hexdigest() + '.trees')
+
+def cached_trees(filename, cache_dir, tree_reader, options, transforms, bulk):
+  '''Yield trees as read_transformed_trees does, loading them from the cache
+  if possible.  Otherwise they are read and, if the whole file is read, saved
+  in the cache (as a binary treebank) for next time.'''
+  path = tree_cache_path(filename, cache_dir, tree_reader, options, transforms)
+  if os.path.exists(path):
+    with binary_treebank.BinaryTreebank(path) as treebank:
+      for tree in treebank:
+        yield tree
+    return
+
+  if not os.path.exists(cache_dir):
+    os.makedirs(cache_dir)
+  # Written under a temporary name so that other readers never see a partial file
+  tmp_path = "{}.{}.tmp".format(path, os.getpid())
+  out = binary_treebank.BinaryTreebankWriter(tmp_path)
+  complete = False
+  try:
+    with open(filename) as source:
+      for tree in read_transformed_trees(source, tree_reader, options, transforms, bulk):
+        # Saved before the tree is yielded, in case it is then modified
+        out.add(tree)
+        yield tree
+    out.close()
+    os.rename(tmp_path, path)
+    complete = True
+  finally:
+    if not complete:
+      out.out.close()
+      os.remove(tmp_path)
+
+def read_transformed_trees(source, tree_reader, options, transforms, bulk):
+  '''Yield trees from the source (None for empty ones), after applying each
+  of the transforms in order.'''
+  return_empty, allow_empty_labels, allow_empty_words, blank_line_coverage = options
+  trees = None
+  if bulk:
+    if tree_reader != ptb_read_tree:
+      raise Exception("Bulk reading is only supported for PTB files")
+    trees = ptb_generate_trees(source, return_empty, allow_empty_labels, allow_empty_words, blank_line_coverage)
+  while True:
+    if trees is not None:
+      tree = next(trees, None)
+    else:
+      tree = tree_reader(source, return_empty, allow_empty_labels, allow_empty_words, blank_line_coverage)
+    if tree == "Empty":
+      yield None
+      continue
+    if tree is None:
+      return
+    for transform in transforms:
+      tree = transform(tree)
+    yield tree
+
+def generate_trees(source, tree_reader=ptb_read_tree, max_sents=-1, return_empty=False, allow_empty_labels=False, allow_empty_words=False, blank_line_coverage=False, bulk=False, transforms=(), cache_dir=None):
   '''Read trees from the given file (opening the file if only a string is given).
+  With bulk set, PTB files are read in large chunks by ptb_generate_trees,
+  rather than a character at a time.  Each function in transforms is applied
+  to every tree, in order (e.g. remove_traces, apply_collins_rules).
+
+  If a cache_dir is given and the source is a filename, the transformed trees
+  are saved there, and later calls with the same file contents, reader, options
+  and transforms load them from the cache instead of parsing the file.
+  Transforms are identified by their code (see function_key), and must be
+  functions or functools.partial objects.
   
   >>> from StringIO import StringIO
   >>> file_text = """(ROOT (S
@@ -508,21 +713,26 @@ def generate_trees(source, tree_reader=ptb_read_tree, max_sents=-1, return_empty
   >>> for tree in generate_trees(in_file):
   ...   print tree
   (ROOT (S (NP-SBJ (NNP Scotty)) (VP (VBD did) (RB not) (VP (VB go) (ADVP (RB back)) (PP (TO to) (NP (NN school))))) (. .)))
-  (ROOT (S (NP-SBJ (DT The) (NN bandit)) (VP (VBZ laughs) (PP (IN in) (NP (PRP$ his) (NN face)))) (. .)))'''
-  if type(source) == type(''):
-    source = open(source)
+  (ROOT (S (NP-SBJ (DT The) (NN bandit)) (VP (VBZ laughs) (PP (IN in) (NP (PRP$ his) (NN face)))) (. .)))
+  >>> in_file = StringIO(file_text)
+  >>> for tree in generate_trees(in_file, transforms=[apply_collins_rules]):
+  ...   print tree
+  (ROOT (S (NP (NNP Scotty)) (VP (VBD did) (RB not) (VP (VB go) (ADVP (RB back)) (PP (TO to) (NP (NN school)))))))
+  (ROOT (S (NP (DT The) (NN bandit)) (VP (VBZ laughs) (PP (IN in) (NP (PRP$ his) (NN face))))))'''
+  options = (return_empty, allow_empty_labels, allow_empty_words, blank_line_coverage)
+  if type(source) == type('') and cache_dir is not None:
+    trees = cached_trees(source, cache_dir, tree_reader, options, transforms, bulk)
+  else:
+    if type(source) == type(''):
+      source = open(source)
+    trees = read_transformed_trees(source, tree_reader, options, transforms, bulk)
   count = 0
-  while True:
-    tree = tree_reader(source, return_empty, allow_empty_labels, allow_empty_words)
-    if tree == "Empty":
-      yield None
-      continue
-    if tree is None:
-      return
+  for tree in trees:
     yield tree
-    count += 1
-    if count >= max_sents > 0:
-      return
+    if tree is not None:
+      count += 1
+      if count >= max_sents > 0:
+        return
 
 def read_trees(source, tree_reader=ptb_read_tree, max_sents=-1, return_empty=False):
   return [tree for tree in generate_trees(source, tree_reader, max_sents, return_empty)]